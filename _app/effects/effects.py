@@ -1,11 +1,20 @@
 import numpy as np
+from utils.audio_utils import float_wave
+
+DELAY_SAMPLES = 4410  # Example delay of 0.1 seconds at 44100 Hz
+
+def apply_effects(wave, effects_type, frame_position=None, frame_length=None):
+    # frame_position/frame_length (per sample) apply the effect frame by frame across a whole timeline.
+    wave = float_wave(wave)
 
-def apply_effects(wave, effects_type):
     if effects_type == 'delay':
-        delay_samples = 4410  # Example delay of 0.1 seconds at 44100 Hz
-        delayed_wave = np.roll(wave, delay_samples)  # Apply delay
+        delay_samples = DELAY_SAMPLES
+        delayed_wave = np.roll(wave, delay_samples, axis=0)  # Apply delay
         delayed_wave[:delay_samples] = 0  # Fill the beginning with zeros to avoid wrapping
-        
+        if frame_position is not None:
+            # Each frame only echoes itself, as when frames were processed one at a time
+            delayed_wave[frame_position < delay_samples] = 0
+
         # Ensure the shapes match
         if wave.shape != delayed_wave.shape:
             min_length = min(wave.shape[0], delayed_wave.shape[0])
@@ -1,9 +1,16 @@
 import numpy as np
+from utils.audio_utils import float_wave
+
+def apply_envelope(wave, envelope_type, frame_position=None, frame_length=None):
+    # frame_position/frame_length (per sample) shape every frame of a whole timeline at once.
+    wave = float_wave(wave)
 
-def apply_envelope(wave, envelope_type):
     if envelope_type == 'fade_in':
         # Example envelope: fade in
-        fade_in = np.linspace(0, 1, len(wave))
-        wave = wave * fade_in
+        if frame_position is None:
+            fade_in = np.linspace(0, 1, len(wave), dtype=wave.dtype)
+        else:
+            fade_in = np.divide(frame_position, np.maximum(frame_length - 1, 1), dtype=wave.dtype)
+        wave *= fade_in[:, None] if wave.ndim == 2 else fade_in
     # More envelope shaping techniques can be added here
     return wave
@@ -0,0 +1,74 @@
+import wave
+import numpy as np
+
+# Chunk-by-chunk mixing and output for app.generate_audio. Loops (drums, a
+# MIDI render shorter than the piece) are read by wrapping indices rather than
+# tiled up front, and chunks are written to the WAV file as int16 frames as
+# soon as they are mixed. Normalizing by the global maximum needs the whole
+# piece, so the mix is rendered twice: a first pass only measures its peak
+# (peak_level), the second scales by it and writes. Memory depends on the
+# chunk size, not on the duration. Everything works on float32 in place, and
+# the generated audio stays mono until pan_stereo turns it into the stereo mix.
+
+def peak_level(chunks):
+    # Loudest absolute sample over all chunks
+    peak = 0.0
+    for chunk in chunks:
+        if len(chunk):
+            peak = max(peak, float(np.abs(chunk).max()))
+    return peak
+
+class PeakLimiter:
+    # Keeps the output within ceiling. Given the piece's peak (from a first pass with peak_level), every
+    # chunk is scaled by ceiling / peak, the same as normalizing by the global maximum. Without one it
+    # only attenuates, by the inverse of the loudest sample so far once that exceeds the ceiling; quieter
+    # audio passes through unchanged rather than being boosted.
+    def __init__(self, ceiling=1.0, peak=None):
+        self.ceiling = ceiling
+        self.gain = ceiling / peak if peak else None
+        # The running peak starts at the ceiling, which caps the gain at 1
+        self.peak = ceiling
+
+    def __call__(self, chunk):
+        # Limits chunk in place
+        if self.gain is not None:
+            chunk *= np.asarray(self.gain, dtype=chunk.dtype)
+            return chunk
+        level = np.abs(chunk).max(axis=1) if chunk.ndim == 2 else np.abs(chunk)
+        running_peak = np.maximum.accumulate(np.maximum(level, self.peak, out=level), out=level)
+        if len(running_peak):
+            self.peak = running_peak[-1]
+        gain = np.divide(self.ceiling, running_peak, out=running_peak)
+        chunk *= gain[:, None] if chunk.ndim == 2 else gain
+        return chunk
+
+def pan_stereo(mono, pan=0.0):
+    # The mono-to-stereo stage: balance from -1 (left) to 1 (right); centered keeps both channels at full level
+    gains = np.array([min(1.0, 1.0 - pan), min(1.0, 1.0 + pan)], dtype=mono.dtype)
+    return mono[:, None] * gains
+
+def loop_slice(signal, start, end):
+    # Samples [start, end) of signal repeated end to end, as np.resize tiles it
+    return np.take(signal, np.arange(start, end) % len(signal), axis=0)
+
+def repeat_chunks(make_chunks, period, total_samples):
+    # (start, chunk) pairs covering total_samples by restarting make_chunks() every period samples
+    for offset in range(0, total_samples, period):
+        for start, chunk in make_chunks():
+            if offset + start >= total_samples:
+                break
+            yield offset + start, chunk[:total_samples - offset - start]
+
+def to_pcm16(chunk):
+    np.clip(chunk, -1.0, 1.0, out=chunk)
+    chunk *= 32767
+    return chunk.astype(np.int16)
+
+def write_wav(file_path, sample_rate, pcm_chunks, channels=2):
+    # Streams int16 chunks to a WAV file; the header's length fields are fixed up on close
+    with wave.open(file_path, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        for pcm in pcm_chunks:
+            wav_file.writeframes(pcm.tobytes())
@@ -1,27 +1,25 @@
 import numpy as np
+from utils.audio_utils import float_wave
+
+def apply_synthesis(wave, synthesis_type, frame_position=None, frame_length=None):
+    # frame_position/frame_length (per sample) apply the per-frame synthesis to a whole timeline at once.
+    wave = float_wave(wave)
 
-def apply_synthesis(wave, synthesis_type):
-    # Ensure wave is in float type to avoid overflow issues
-    wave = wave.astype(float)
-    
     if synthesis_type == 'additive':
         # Generate additional_wave based on the length of the input wave
-        additional_wave = np.sin(2 * np.pi * np.arange(len(wave)) * 2 / len(wave))
-        
-        # Ensure additional_wave has the same shape as wave
-        if wave.ndim == 1:
-            # Mono wave, convert additional_wave to mono
-            additional_wave = additional_wave
-        elif wave.ndim == 2:
-            # Stereo wave, convert additional_wave to stereo by duplicating
-            additional_wave = np.column_stack((additional_wave, additional_wave))
-        
-        # Ensure both arrays are of the same shape for addition
-        if wave.shape != additional_wave.shape:
-            raise ValueError("Shape mismatch: 'wave' and 'additional_wave' must have the same shape.")
-        
-        # Apply synthesis (addition)
-        wave += additional_wave
+        if frame_position is None:
+            additional_wave = np.arange(len(wave), dtype=wave.dtype) / np.asarray(len(wave), dtype=wave.dtype)
+        else:
+            additional_wave = np.divide(frame_position, frame_length, dtype=wave.dtype)
+        additional_wave *= 2 * np.pi * 2
+        np.sin(additional_wave, out=additional_wave)
+
+        # Ensure both arrays are of the same length for addition
+        if len(wave) != len(additional_wave):
+            raise ValueError("Shape mismatch: 'wave' and 'additional_wave' must have the same length.")
+
+        # Apply synthesis (addition); a stereo wave gets the same partial in both channels
+        wave += additional_wave[:, None] if wave.ndim == 2 else additional_wave
 
     # More synthesis techniques can be added here
 
@@ -0,0 +1,121 @@
+import numpy as np
+from utils.audio_utils import timeline_waveform
+from utils.filters import StreamingLowpass, ModulatedLowpass
+from utils.wavetables import wavetable_bank
+from _app.effects.synthesis import apply_synthesis
+from _app.effects.envelope import apply_envelope
+from _app.effects.effects import apply_effects, DELAY_SAMPLES
+
+# Renders the per-frame synthesis of app.generate_audio for the whole piece at
+# once. Frame i covers samples [starts[i], starts[i + 1]) and sounds at its own
+# frequency (the frame's brightness in Hz); the phase is the integral of that
+# per-sample frequency curve, so it runs on across frame boundaries instead of
+# restarting at zero every frame. Per-frame synthesis, envelopes and effects
+# get each sample's position within its frame and that frame's length, so they
+# still shape every frame on its own, just vectorized. iter_chunks renders the
+# piece in fixed-size chunks so memory does not grow with its duration.
+# Oscillators read band-limited wavetables by default; oscillator='naive'
+# evaluates the wave formulas directly. Given per-frame cutoffs, the
+# 'subtractive' lowpass follows them frame by frame.
+
+CHUNK_SAMPLES = 1 << 16
+OSCILLATORS = ('wavetable', 'naive')
+
+class FrameTimeline:
+    def __init__(self, frequencies, frame_duration, sample_rate, num_samples, oscillator='wavetable', cutoffs=None):
+        if oscillator not in OSCILLATORS:
+            raise ValueError(f"Unsupported oscillator: {oscillator}")
+        self.bank = wavetable_bank(sample_rate) if oscillator == 'wavetable' else None
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.octaves = self.bank.octave(self.frequencies) if self.bank is not None else None
+        self.cutoffs = np.asarray(cutoffs, dtype=np.float64) if cutoffs is not None else None
+        self.sample_rate = sample_rate
+        self.num_samples = num_samples
+        self.starts = (np.arange(len(self.frequencies)) * frame_duration * sample_rate).astype(np.int64)
+        self.lengths = np.diff(self.starts, append=num_samples)
+        # Phase in cycles at each frame start; any sample range can be rendered from these
+        cycles = self.frequencies * self.lengths / sample_rate
+        self.start_phases = np.concatenate(([0.0], np.cumsum(cycles)[:-1]))
+
+    def segments(self, start, end):
+        # First frame of samples [start, end) and how many of those samples fall in each frame from there on
+        first, last = np.searchsorted(self.starts, [start, end - 1], side='right') - 1
+        bounds = np.clip(np.append(self.starts[first + 1:last + 1], end), start, end)
+        return first, np.diff(bounds, prepend=start)
+
+    def frame_positions(self, start=0, end=None):
+        # Position of each sample within its frame, and that frame's length
+        end = self.num_samples if end is None else end
+        first, counts = self.segments(start, end)
+        frames = slice(first, first + len(counts))
+        position = np.arange(start, end) - np.repeat(self.starts[frames], counts)
+        return position, np.repeat(self.lengths[frames], counts)
+
+    def frequency_curve(self, start=0, end=None):
+        end = self.num_samples if end is None else end
+        first, counts = self.segments(start, end)
+        return np.repeat(self.frequencies[first:first + len(counts)], counts)
+
+    def octave_curve(self, start=0, end=None):
+        # Each sample's wavetable octave; None without a wavetable bank
+        if self.bank is None:
+            return None
+        end = self.num_samples if end is None else end
+        first, counts = self.segments(start, end)
+        return np.repeat(self.octaves[first:first + len(counts)], counts)
+
+    def phase(self, start=0, end=None):
+        # Phase in cycles of samples [start, end): the running integral of the frequency curve
+        end = self.num_samples if end is None else end
+        first, counts = self.segments(start, end)
+        frames = slice(first, first + len(counts))
+        step = self.frequencies[frames] / self.sample_rate
+        phase = np.arange(start, end, dtype=np.float64)
+        phase *= np.repeat(step, counts)
+        phase += np.repeat(self.start_phases[frames] - self.starts[frames] * step, counts)
+        return phase
+
+    def lowpass(self):
+        # A fresh filter for 'subtractive': modulated by the frame cutoffs when there are any
+        return ModulatedLowpass() if self.cutoffs is not None else StreamingLowpass()
+
+    def render_dry(self, wave_type, synthesis_type=None, envelope_type=None, include_sine=True, start=0, end=None, lowpass=None):
+        # Samples [start, end) before effects, with the sample positions and frame lengths the effects need
+        end = self.num_samples if end is None else end
+        phase = self.phase(start, end)
+        position, frame_length = self.frame_positions(start, end)
+        octave = self.octave_curve(start, end)
+
+        if wave_type == 'subtractive' and self.cutoffs is not None:
+            first, counts = self.segments(start, end)
+            source = timeline_waveform('square', phase, octave=octave, bank=self.bank)
+            wave = (lowpass or self.lowpass())(source, self.cutoffs[first:first + len(counts)], counts).astype(np.float32)
+        else:
+            wave = timeline_waveform(wave_type, phase, lowpass, octave, self.bank)
+        if synthesis_type:
+            wave = apply_synthesis(wave, synthesis_type, position, frame_length)
+        if include_sine:
+            wave += timeline_waveform('sine', phase) * 0.5  # Mix in sine wave
+        if envelope_type:
+            wave = apply_envelope(wave, envelope_type, position, frame_length)
+        return wave, position, frame_length
+
+    def render(self, wave_type, synthesis_type=None, envelope_type=None, effects_type=None, include_sine=True, start=0, end=None):
+        # Mono float32 samples [start, end) of the piece, mixed as generate_audio mixes each frame
+        wave, position, frame_length = self.render_dry(wave_type, synthesis_type, envelope_type, include_sine, start, end)
+        return apply_effects(wave, effects_type, position, frame_length)
+
+    def iter_chunks(self, wave_type, synthesis_type=None, envelope_type=None, effects_type=None, include_sine=True, chunk_samples=CHUNK_SAMPLES):
+        # The whole piece as consecutive (start, samples) chunks, identical to render() in one go. The
+        # lowpass state and the dry samples the delay still has to echo are carried from chunk to chunk.
+        lowpass = self.lowpass()
+        history = DELAY_SAMPLES if effects_type == 'delay' else 0
+        tail = (np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        for start in range(0, self.num_samples, chunk_samples):
+            end = min(start + chunk_samples, self.num_samples)
+            wave, position, frame_length = self.render_dry(wave_type, synthesis_type, envelope_type, include_sine, start, end, lowpass)
+            if history:
+                wave, position, frame_length = (np.concatenate(parts) for parts in zip(tail, (wave, position, frame_length)))
+                tail = tuple(part[-history:].copy() for part in (wave, position, frame_length))
+            wave = apply_effects(wave, effects_type, position, frame_length)
+            yield start, wave[len(wave) - (end - start):]
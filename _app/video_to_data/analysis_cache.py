@@ -0,0 +1,85 @@
+import os
+import json
+import shutil
+import hashlib
+from utils.feature_store import FORMAT_VERSION, is_feature_store, copy_feature_store
+
+# Content-addressed cache of feature stores. An entry is keyed by a hash of the
+# video bytes plus the analysis settings, so renaming or moving a video still
+# hits, while any change to the file or the settings misses. Entries are
+# evicted least-recently-used first once the cache grows past max_bytes.
+
+CACHE_DIR = 'output/.cache'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+DIGEST_INDEX_FILE = 'digests.json'
+HASH_CHUNK_SIZE = 1 << 20
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as video_file:
+        for chunk in iter(lambda: video_file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+class AnalysisCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'entries'), exist_ok=True)
+
+    def video_digest(self, video_path):
+        # Hashing a long video takes seconds, so digests are remembered per (path, size, mtime)
+        index_path = os.path.join(self.cache_dir, DIGEST_INDEX_FILE)
+        try:
+            with open(index_path, 'r') as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            index = {}
+        stat = os.stat(video_path)
+        stamp = f'{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+        if stamp not in index:
+            index[stamp] = file_digest(video_path)
+            tmp_path = index_path + '.tmp'
+            with open(tmp_path, 'w') as index_file:
+                json.dump(index, index_file)
+            os.replace(tmp_path, index_path)
+        return index[stamp]
+
+    def key(self, video_path, settings):
+        payload = json.dumps({'video': self.video_digest(video_path), 'settings': settings, 'format': FORMAT_VERSION}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, 'entries', key)
+
+    def get(self, key):
+        entry_dir = self.entry_dir(key)
+        if not is_feature_store(entry_dir):
+            return None
+        # The entry directory's mtime is its last-used time for LRU eviction
+        os.utime(entry_dir)
+        return entry_dir
+
+    def put(self, key, store_dir):
+        entry_dir = copy_feature_store(store_dir, self.entry_dir(key))
+        self.evict(keep=key)
+        return entry_dir
+
+    def evict(self, keep=None):
+        entries_dir = os.path.join(self.cache_dir, 'entries')
+        entries = []
+        for key in os.listdir(entries_dir):
+            entry_dir = os.path.join(entries_dir, key)
+            if os.path.isdir(entry_dir):
+                entries.append((os.path.getmtime(entry_dir), directory_size(entry_dir), key, entry_dir))
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, key, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
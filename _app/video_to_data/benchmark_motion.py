@@ -0,0 +1,58 @@
+import argparse
+import time
+import cv2
+import numpy as np
+from _app.video_to_data.motion import MOTION_BACKENDS
+from _app.video_to_data.frame_sources import crop_to_center
+
+# Compares every motion backend against the full-resolution Farneback output
+# that video_to_data has always produced: cost per frame, speedup, and how well
+# each backend's motion curve follows the reference (Pearson r and mean scale).
+
+def load_gray_crops(video_path, max_frames):
+    cap = cv2.VideoCapture(video_path)
+    grays = []
+    while len(grays) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        grays.append(cv2.cvtColor(crop_to_center(frame), cv2.COLOR_BGR2GRAY))
+    cap.release()
+    return grays
+
+def run_backend(estimator, grays):
+    estimator(grays[0], grays[1])  # warm-up, e.g. DIS instance creation
+    start = time.perf_counter()
+    values = [estimator(prev_gray, gray) for prev_gray, gray in zip(grays, grays[1:])]
+    elapsed = time.perf_counter() - start
+    return np.array(values), elapsed / len(values)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark motion backends against full-resolution Farneback flow.')
+    parser.add_argument('--video', type=str, required=True, help='Path to the video file')
+    parser.add_argument('--max-frames', type=int, default=300, help='Number of frames to analyse (default: 300)')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    grays = load_gray_crops(args.video, args.max_frames)
+    if len(grays) < 3:
+        raise SystemExit(f"Need at least 3 frames, got {len(grays)} from {args.video}")
+
+    reference, reference_cost = run_backend(MOTION_BACKENDS['farneback'], grays)
+
+    print(f"{len(grays)} frames of {grays[0].shape[1]}x{grays[0].shape[0]} (center crop)")
+    print(f"{'backend':<20}{'ms/frame':>10}{'speedup':>10}{'pearson r':>12}{'scale':>10}")
+    for name, estimator in MOTION_BACKENDS.items():
+        if name == 'farneback':
+            values, cost = reference, reference_cost
+        else:
+            values, cost = run_backend(estimator, grays)
+        if np.std(values) > 0 and np.std(reference) > 0:
+            correlation = np.corrcoef(values, reference)[0, 1]
+        else:
+            correlation = float('nan')
+        scale = values.mean() / reference.mean() if reference.mean() > 0 else float('nan')
+        print(f"{name:<20}{cost * 1000:>10.2f}{reference_cost / cost:>10.1f}{correlation:>12.3f}{scale:>10.2f}")
+
+if __name__ == '__main__':
+    main()
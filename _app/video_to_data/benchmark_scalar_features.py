@@ -0,0 +1,102 @@
+import argparse
+import time
+import cv2
+import numpy as np
+from _app.video_to_data.frame_sources import crop_to_center
+
+# Compares the per-frame scalar features of analyze_frame (avg_color, mass,
+# brightness, contrast, one OpenCV call each) with block versions that stack K
+# crops into a (K, H, W, 3) array and reduce the whole block at once, with
+# NumPy or with cv2.reduce. Prints the cost per frame and the largest deviation
+# from the per-frame values.
+
+def load_crops(video_path, max_frames, crop_fraction=0.5, scale=1.0):
+    cap = cv2.VideoCapture(video_path)
+    crops = []
+    while len(crops) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        crop = crop_to_center(frame, crop_fraction)
+        if scale != 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        crops.append(crop)
+    cap.release()
+    return crops, [cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) for crop in crops]
+
+def scalar_features(crop, gray):
+    # Same calls as analyze_frame
+    avg_color = cv2.mean(crop)[:3]
+    mass = cv2.countNonZero(cv2.inRange(crop, (0, 0, 0), (100, 100, 100)))
+    mean, std = cv2.meanStdDev(gray)
+    return avg_color, mass, mean[0, 0], std[0, 0]
+
+def per_frame_features(crops, grays):
+    features = [scalar_features(crop, gray) for crop, gray in zip(crops, grays)]
+    avg_color, mass, brightness, contrast = zip(*features)
+    return np.array(avg_color), np.array(mass), np.array(brightness), np.array(contrast)
+
+def numpy_block_features(crops, grays):
+    block, gray_block = np.stack(crops), np.stack(grays)
+    k = len(block)
+    avg_color = block.reshape(k, -1, 3).mean(axis=1)
+    mass = (block <= 100).all(axis=3).sum(axis=(1, 2))
+    gray_values = gray_block.reshape(k, -1).astype(np.float64)
+    return avg_color, mass, gray_values.mean(axis=1), gray_values.std(axis=1)
+
+def reduce_block_features(crops, grays):
+    block, gray_block = np.stack(crops), np.stack(grays)
+    k, height, width, _ = block.shape
+    pixels = height * width
+    # Each frame becomes one row of a 3-channel image, so a row reduction gives per-frame channel sums
+    avg_color = cv2.reduce(block.reshape(k, pixels, 3), 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F).reshape(k, 3) / pixels
+    mask = cv2.inRange(block.reshape(k * height, width, 3), (0, 0, 0), (100, 100, 100)).reshape(k, pixels)
+    mass = cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+    gray_rows = gray_block.reshape(k, pixels)
+    sums = cv2.reduce(gray_rows, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F).ravel()
+    squares = cv2.reduce(np.square(gray_rows, dtype=np.float32), 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F).ravel()
+    brightness = sums / pixels
+    contrast = np.sqrt(np.maximum(squares / pixels - brightness ** 2, 0))
+    return avg_color, mass, brightness, contrast
+
+METHODS = {
+    'per-frame': per_frame_features,
+    'numpy-block': numpy_block_features,
+    'reduce-block': reduce_block_features,
+}
+
+def run_method(method, crops, grays, block_size):
+    blocks = [(crops[i:i + block_size], grays[i:i + block_size]) for i in range(0, len(crops), block_size)]
+    method(*blocks[0])  # warm-up
+    start = time.perf_counter()
+    results = [method(block_crops, block_grays) for block_crops, block_grays in blocks]
+    elapsed = time.perf_counter() - start
+    return [np.concatenate(feature) for feature in zip(*results)], elapsed / len(crops)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-frame against block-vectorized scalar features.')
+    parser.add_argument('--video', type=str, required=True, help='Path to the video file')
+    parser.add_argument('--max-frames', type=int, default=256, help='Number of frames to analyse (default: 256)')
+    parser.add_argument('--block-size', type=int, default=16, help='Frames per block (default: 16)')
+    parser.add_argument('--scale', type=float, default=1.0, help='Downscale the crops first, as --decode-scale does (default: 1.0)')
+    args = parser.parse_args()
+
+    cv2.setNumThreads(1)
+    crops, grays = load_crops(args.video, args.max_frames, scale=args.scale)
+    if not crops:
+        raise SystemExit(f"No frames read from {args.video}")
+
+    reference, reference_cost = run_method(per_frame_features, crops, grays, args.block_size)
+
+    print(f"{len(crops)} crops of {crops[0].shape[1]}x{crops[0].shape[0]}, blocks of {args.block_size}")
+    print(f"{'method':<16}{'ms/frame':>10}{'speedup':>10}{'max deviation':>16}")
+    for name, method in METHODS.items():
+        if method is per_frame_features:
+            features, cost = reference, reference_cost
+        else:
+            features, cost = run_method(method, crops, grays, args.block_size)
+        deviation = max(float(np.max(np.abs(np.asarray(value, dtype=np.float64) - expected))) for value, expected in zip(features, reference))
+        print(f"{name:<16}{cost * 1000:>10.3f}{reference_cost / cost:>10.2f}{deviation:>16.2e}")
+
+if __name__ == '__main__':
+    main()
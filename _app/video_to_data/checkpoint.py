@@ -0,0 +1,108 @@
+import os
+import json
+import shutil
+import numpy as np
+from utils.feature_store import FRAME_COLUMNS, frames_to_columns, dominant_color_dicts
+
+# Append-only checkpoints for long analyses. Every `every` analysed frames the
+# new samples are written as one chunk file holding their feature columns,
+# frame indices, scene-cut flags and the part of the overall color histogram
+# they added. A run that dies keeps everything up to its last chunk, and
+# --resume carries on after it. checkpoint.json records which video and
+# settings the chunks belong to; chunks for anything else are discarded.
+
+CHECKPOINT_FILE = 'checkpoint.json'
+DEFAULT_CHECKPOINT_EVERY = 1000
+
+def video_identity(video_path, settings):
+    stat = os.stat(video_path)
+    return {'video': os.path.abspath(video_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'settings': settings}
+
+def sum_histogram_bins(histograms):
+    # Adds sparse (occupied, counts, sums) color histograms into one, bins may repeat across inputs
+    occupied, inverse = np.unique(np.concatenate([bins[0] for bins in histograms]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([bins[1] for bins in histograms]), minlength=len(occupied))
+    all_sums = np.concatenate([bins[2] for bins in histograms])
+    sums = np.stack([np.bincount(inverse, weights=all_sums[:, c], minlength=len(occupied)) for c in range(3)], axis=1)
+    return occupied, counts, sums
+
+def columns_to_samples(chunk):
+    # Inverse of frames_to_columns for one chunk, plus the per-sample 'cut' flag
+    palette = chunk['palette'].tolist()
+    samples = []
+    for i in range(len(chunk['frame_index'])):
+        sample = {name: chunk[name][i].tolist() for name in FRAME_COLUMNS}
+        count = int(chunk['dominant_count'][i]) if 'dominant_count' in chunk else None
+        sample['dominant_colors'] = dominant_color_dicts(chunk['dominant_rgb'][i], chunk['dominant_name'][i], palette, count)
+        sample['cut'] = bool(chunk['cut'][i])
+        samples.append(sample)
+    return samples
+
+class AnalysisCheckpoint:
+    def __init__(self, checkpoint_dir, identity, every=DEFAULT_CHECKPOINT_EVERY):
+        self.checkpoint_dir = checkpoint_dir
+        self.identity = identity
+        self.every = max(1, every)
+        self.pending_indices = []
+        self.pending_samples = []
+        self.pending_bins = []
+
+    def chunk_paths(self):
+        names = sorted(name for name in os.listdir(self.checkpoint_dir) if name.startswith('chunk_') and name.endswith('.npz'))
+        return [os.path.join(self.checkpoint_dir, name) for name in names]
+
+    def load(self):
+        # Samples and color histogram of an earlier run of the same video and settings:
+        # (frame_indices, samples, (occupied, counts, sums)), or None if there is nothing to resume
+        try:
+            with open(os.path.join(self.checkpoint_dir, CHECKPOINT_FILE), 'r') as checkpoint_file:
+                identity = json.load(checkpoint_file)
+        except (OSError, ValueError):
+            return None
+        if identity != self.identity:
+            return None
+        frame_indices = []
+        samples = []
+        histograms = []
+        for chunk_path in self.chunk_paths():
+            with np.load(chunk_path) as chunk:
+                frame_indices.extend(chunk['frame_index'].tolist())
+                samples.extend(columns_to_samples(chunk))
+                histograms.append((chunk['color_occupied'], chunk['color_counts'], chunk['color_sums']))
+        if not samples:
+            return None
+        return frame_indices, samples, sum_histogram_bins(histograms)
+
+    def start(self):
+        # Begins a fresh checkpoint, dropping chunks from any earlier run
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        os.makedirs(self.checkpoint_dir)
+        with open(os.path.join(self.checkpoint_dir, CHECKPOINT_FILE), 'w') as checkpoint_file:
+            json.dump(self.identity, checkpoint_file, indent=4)
+
+    def add(self, frame_idx, frame_data, color_bins):
+        self.pending_indices.append(frame_idx)
+        self.pending_samples.append(frame_data)
+        self.pending_bins.append(color_bins)
+        if len(self.pending_samples) >= self.every:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_samples:
+            return
+        columns, palette = frames_to_columns(self.pending_samples)
+        occupied, counts, sums = sum_histogram_bins(self.pending_bins)
+
+        chunk_path = os.path.join(self.checkpoint_dir, f'chunk_{self.pending_indices[-1]:09d}.npz')
+        tmp_path = chunk_path + '.tmp'
+        with open(tmp_path, 'wb') as chunk_file:
+            np.savez(chunk_file, frame_index=np.array(self.pending_indices, dtype=np.int64),
+                     cut=np.array([sample.get('cut', False) for sample in self.pending_samples], dtype=bool),
+                     palette=np.array(palette, dtype=str), color_occupied=occupied, color_counts=counts, color_sums=sums, **columns)
+        os.replace(tmp_path, chunk_path)
+        self.pending_indices = []
+        self.pending_samples = []
+        self.pending_bins = []
+
+    def clear(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
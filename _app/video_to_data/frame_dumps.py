@@ -0,0 +1,92 @@
+import os
+import cv2
+import numpy as np
+from threading import Thread
+from queue import Queue, Full
+
+# Debug frame dumps for video_to_data, written off the analysis path by a
+# background thread. Modes:
+#   every          cropped and resized PNGs of every Nth frame
+#   contact-sheet  one PNG tiling a thumbnail of every Nth frame
+#   video          one preview video of every Nth cropped frame
+DUMP_MODES = ['off', 'every', 'contact-sheet', 'video']
+
+# Frames allowed to wait for the writer; beyond this dumps are dropped rather than stalling analysis
+DUMP_QUEUE_SIZE = 64
+CONTACT_SHEET_COLUMNS = 10
+CONTACT_SHEET_THUMB_WIDTH = 160
+
+def save_frame(image, folder_path, frame_idx, stage):
+    file_path = os.path.join(folder_path, f'{stage}_frame_{frame_idx}.png')
+    cv2.imwrite(file_path, image)
+
+class FrameDumpWriter:
+    def __init__(self, mode, folder_path, every=30, fps=30.0):
+        if mode not in DUMP_MODES or mode == 'off':
+            raise ValueError(f"Unsupported dump mode: {mode}")
+        self.mode = mode
+        self.folder_path = folder_path
+        self.every = max(1, every)
+        self.fps = fps
+        self.dropped = 0
+        self.thumbnails = []
+        self.video_writer = None
+        os.makedirs(folder_path, exist_ok=True)
+        self.queue = Queue(maxsize=DUMP_QUEUE_SIZE)
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame_idx, crop):
+        # Called from the decode thread; never blocks
+        if frame_idx % self.every:
+            return
+        try:
+            # Copied, since the frame source may reuse the crop's buffer for the next frame
+            self.queue.put_nowait((frame_idx, crop.copy()))
+        except Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            frame_idx, crop = item
+            if self.mode == 'every':
+                save_frame(crop, self.folder_path, frame_idx, 'cropped')
+                save_frame(cv2.resize(crop, (crop.shape[1] // 8, crop.shape[0] // 8)), self.folder_path, frame_idx, 'resized')
+            elif self.mode == 'contact-sheet':
+                height = max(1, crop.shape[0] * CONTACT_SHEET_THUMB_WIDTH // crop.shape[1])
+                self.thumbnails.append(cv2.resize(crop, (CONTACT_SHEET_THUMB_WIDTH, height), interpolation=cv2.INTER_AREA))
+            elif self.mode == 'video':
+                self.write_video_frame(crop)
+
+    def write_video_frame(self, crop):
+        preview = cv2.resize(crop, (crop.shape[1] // 2, crop.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        if self.video_writer is None:
+            video_path = os.path.join(self.folder_path, 'preview.mp4')
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            self.video_writer = cv2.VideoWriter(video_path, fourcc, max(1.0, self.fps / self.every), (preview.shape[1], preview.shape[0]))
+        self.video_writer.write(preview)
+
+    def write_contact_sheet(self):
+        if not self.thumbnails:
+            return
+        thumb_height = self.thumbnails[0].shape[0]
+        rows = -(-len(self.thumbnails) // CONTACT_SHEET_COLUMNS)
+        sheet = np.zeros((rows * thumb_height, CONTACT_SHEET_COLUMNS * CONTACT_SHEET_THUMB_WIDTH, 3), dtype=np.uint8)
+        for i, thumbnail in enumerate(self.thumbnails):
+            row, col = divmod(i, CONTACT_SHEET_COLUMNS)
+            x = col * CONTACT_SHEET_THUMB_WIDTH
+            sheet[row * thumb_height:(row + 1) * thumb_height, x:x + CONTACT_SHEET_THUMB_WIDTH] = thumbnail
+        cv2.imwrite(os.path.join(self.folder_path, 'contact_sheet.png'), sheet)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.mode == 'contact-sheet':
+            self.write_contact_sheet()
+        elif self.video_writer is not None:
+            self.video_writer.release()
+        if self.dropped:
+            print(f"Frame dump writer fell behind and skipped {self.dropped} frames")
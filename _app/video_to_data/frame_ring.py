@@ -0,0 +1,146 @@
+import os
+import numpy as np
+from queue import Queue, Empty
+from threading import Lock
+from multiprocessing import shared_memory, resource_tracker
+
+# Ring of shared-memory frame slots for handing frames to pool workers without
+# pickling them. The decoder copies a frame's arrays into a free slot and sends
+# only a small descriptor (block name, slot id, frame idx and each array's
+# shape, dtype and offset); the worker maps the arrays in place. A slot goes
+# back to the free list once the collector has the frame's result, so the
+# number of slots also bounds how many frames are in flight. Closing the ring
+# wakes a decoder waiting for a slot, and a closed ring is never re-allocated.
+# A ring whose block does not fit in the free shared memory is not allocated at
+# all, so the caller can fall back to pickling frames. Workers drop their
+# mapping of a block once its ring has closed (and unlinked it), so a finished
+# video's frames do not stay in memory for the rest of a batch.
+
+SLOT_ALIGNMENT = 64
+# How often put() checks for close() while waiting for a free slot
+SLOT_POLL_SECONDS = 0.1
+
+# Where POSIX shared memory blocks live as files, on Linux
+SHM_DIR = '/dev/shm'
+
+# Blocks a worker process has attached to, by name; kept small since batch runs use one ring per video
+_attached = {}
+MAX_ATTACHED = 4
+
+def aligned(nbytes):
+    return -(-nbytes // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+
+class FrameRing:
+    def __init__(self, slots):
+        self.slots = slots
+        self.shm = None
+        self.slot_bytes = 0
+        self.free_slots = Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+        self.frame_slots = {}
+        self.closed = False
+        # Held while the block is written or torn down, so close() never pulls it from under a copy
+        self.lock = Lock()
+
+    def allocate(self, arrays):
+        # Sizes every slot to hold arrays like these; called once the first frame's shapes are known.
+        # Returns whether the ring can take frames: False once closed, or if the block does not fit.
+        with self.lock:
+            if self.closed or self.shm is not None:
+                return self.shm is not None
+            slot_bytes = sum(aligned(array.nbytes) for array in arrays)
+            room = shm_room()
+            if room is not None and slot_bytes * self.slots > room:
+                return False
+            try:
+                self.shm = shared_memory.SharedMemory(create=True, size=slot_bytes * self.slots)
+            except OSError:
+                return False
+            self.slot_bytes = slot_bytes
+            return True
+
+    def put(self, frame_idx, arrays):
+        # Called from the decode thread; blocks until a slot is free. Returns the descriptor, or None
+        # once the ring is closed. None entries (e.g. no motion reference) take no space and read back as None.
+        while True:
+            if self.closed:
+                return None
+            try:
+                slot = self.free_slots.get(timeout=SLOT_POLL_SECONDS)
+                break
+            except Empty:
+                pass
+        with self.lock:
+            if self.shm is None:
+                return None
+            offset = slot * self.slot_bytes
+            layout = []
+            for array in arrays:
+                if array is None:
+                    layout.append(None)
+                    continue
+                view = np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf, offset=offset)
+                np.copyto(view, array)
+                del view
+                layout.append((array.shape, array.dtype.str, offset))
+                offset += aligned(array.nbytes)
+            self.frame_slots[frame_idx] = slot
+            return self.shm.name, slot, frame_idx, layout
+
+    def release(self, frame_idx):
+        slot = self.frame_slots.pop(frame_idx, None)
+        if slot is not None:
+            self.free_slots.put(slot)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.shm is not None:
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = None
+
+def shm_room():
+    # Free bytes for shared memory blocks, or None where that cannot be told. The block is only
+    # backed by memory as it is written, so one that does not fit would fail later, with SIGBUS.
+    try:
+        stat = os.statvfs(SHM_DIR)
+    except (OSError, AttributeError):
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+def detach_unlinked(keep):
+    # Closes this worker's mappings of blocks whose ring has been closed, other than keep
+    if not os.path.isdir(SHM_DIR):
+        return
+    for name in list(_attached):
+        if name != keep and not os.path.exists(os.path.join(SHM_DIR, name.lstrip('/'))):
+            _attached.pop(name).close()
+
+def attach(name):
+    detach_unlinked(name)
+    shm = _attached.get(name)
+    if shm is None:
+        if len(_attached) >= MAX_ATTACHED:
+            _attached.pop(next(iter(_attached))).close()
+        try:
+            # The creating process owns the block and unlinks it. Workers must not register it
+            # with a resource tracker, or the block is unlinked (and warned about) when they exit.
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching always registers, so skip that step
+            register = resource_tracker.register
+            resource_tracker.register = lambda *args, **kwargs: None
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            finally:
+                resource_tracker.register = register
+        _attached[name] = shm
+    return shm
+
+def read_slot(descriptor):
+    # Worker side: the descriptor's arrays as views into the shared block, valid until the slot is released
+    name, _, _, layout = descriptor
+    buf = attach(name).buf
+    return [np.ndarray(entry[0], dtype=entry[1], buffer=buf, offset=entry[2]) if entry is not None else None for entry in layout]
@@ -0,0 +1,124 @@
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+# Frame sources for video_to_data. A source delivers each frame together with
+# its center crop, optionally scaled by `scale`, and supports grab() to skip a
+# frame and seek() to jump to a frame index:
+#   cv2     cv2.VideoCapture decodes full frames; cropped and scaled in NumPy/OpenCV
+#   ffmpeg  an ffmpeg process crops and scales while decoding and streams raw BGR
+#           frames through a pipe into a preallocated buffer, so full-size frames
+#           never reach Python. Falls back to cv2 when ffmpeg is not installed.
+# `frame` is what whole-frame checks (cut detection, adaptive sampling) look at:
+# the full frame for cv2 and the crop itself for ffmpeg.
+
+def crop_to_center(frame, crop_fraction=0.5):
+    height, width, _ = frame.shape
+    start_x, start_y, end_x, end_y = crop_box(width, height, crop_fraction)
+    return frame[start_y:end_y, start_x:end_x]
+
+def crop_box(width, height, crop_fraction=0.5):
+    start_x = int((1 - crop_fraction) / 2 * width)
+    start_y = int((1 - crop_fraction) / 2 * height)
+    end_x = int(start_x + crop_fraction * width)
+    end_y = int(start_y + crop_fraction * height)
+    return start_x, start_y, end_x, end_y
+
+def scaled_size(width, height, scale):
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+class CaptureFrameSource:
+    def __init__(self, video_path, crop_fraction=0.5, scale=1.0):
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open video {video_path}")
+        self.crop_fraction = crop_fraction
+        self.scale = scale
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def read(self):
+        # Returns (ok, frame, crop)
+        ret, frame = self.cap.read()
+        if not ret:
+            return False, None, None
+        crop = crop_to_center(frame, self.crop_fraction)
+        if self.scale != 1.0:
+            crop = cv2.resize(crop, scaled_size(crop.shape[1], crop.shape[0], self.scale), interpolation=cv2.INTER_AREA)
+        return True, frame, crop
+
+    def grab(self):
+        return self.cap.grab()
+
+    def seek(self, frame_idx):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+
+    def release(self):
+        self.cap.release()
+
+class FFmpegFrameSource:
+    def __init__(self, video_path, crop_fraction=0.5, scale=1.0):
+        # Stream properties come from OpenCV so both sources agree on fps and frame count
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Cannot open video {video_path}")
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+
+        self.video_path = video_path
+        self.scale = scale
+        start_x, start_y, end_x, end_y = crop_box(width, height, crop_fraction)
+        self.out_width, self.out_height = scaled_size(end_x - start_x, end_y - start_y, scale)
+        self.filters = f'crop={end_x - start_x}:{end_y - start_y}:{start_x}:{start_y}'
+        if scale != 1.0:
+            self.filters += f',scale={self.out_width}:{self.out_height}:flags=area'
+        # read() fills this buffer in place; consumers that keep a crop past the next read must copy it
+        self.buffer = np.empty((self.out_height, self.out_width, 3), dtype=np.uint8)
+        self.process = None
+        self.seek(0)
+
+    def seek(self, frame_idx):
+        self.release()
+        command = ['ffmpeg', '-v', 'error', '-nostdin']
+        if frame_idx > 0:
+            # Input seeking decodes up to the target and drops earlier frames; half a frame back
+            # keeps rounding from skipping the frame itself
+            command += ['-ss', f'{(frame_idx - 0.5) / self.fps:.6f}']
+        command += ['-i', self.video_path, '-vf', self.filters, '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-vsync', 'passthrough', 'pipe:1']
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=self.buffer.nbytes)
+
+    def read(self):
+        if self.process.stdout.readinto(memoryview(self.buffer).cast('B')) != self.buffer.nbytes:
+            return False, None, None
+        return True, self.buffer, self.buffer
+
+    def grab(self):
+        # The pipe always carries every frame; skipping one just discards it
+        return self.read()[0]
+
+    def release(self):
+        if self.process is not None:
+            # Killed before its pipe closes, so an early stop is not reported as a write error
+            self.process.kill()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+FRAME_SOURCES = {
+    'cv2': CaptureFrameSource,
+    'ffmpeg': FFmpegFrameSource,
+}
+
+def open_frame_source(video_path, source='cv2', crop_fraction=0.5, scale=1.0):
+    try:
+        source_class = FRAME_SOURCES[source]
+    except KeyError:
+        raise ValueError(f"Unsupported frame source: {source}")
+    if source_class is FFmpegFrameSource and shutil.which('ffmpeg') is None:
+        print("ffmpeg not found, decoding with OpenCV instead")
+        source_class = CaptureFrameSource
+    return source_class(video_path, crop_fraction, scale)
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import cv2
+import numpy as np
+from _app.video_to_data.motion import MOTION_BACKENDS
+from _app.video_to_data.frame_sources import crop_to_center, scaled_size
+from _app.video_to_data.video_to_data import (SceneCutDetector, DominantColorTracker, analyze_frame_job, dominant_colors_info,
+                                              lab_to_rgb, init_worker)
+
+# Live feature extraction from a camera, stream URL or (for testing) a local
+# file played back in real time. A capture thread keeps only the newest frame;
+# the analysis always takes the newest one and frames that arrive while it is
+# busy are dropped, not queued. A record is therefore at most one analysis plus
+# one frame interval old, however slow the analysis is, and every record says
+# how many frames were dropped before it.
+#
+#   python -m _app.video_to_data.live --source 0
+#   python -m _app.video_to_data.live --source src/mp4/clip.mp4 --loop
+#
+# Records are printed as JSON lines, one per analysed frame.
+
+class LiveCapture:
+    def __init__(self, source, loop=False):
+        # source: a device index, a stream URL, or a file path
+        self.is_file = os.path.isfile(str(source))
+        self.cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open capture source {source}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.loop = loop
+        self.condition = threading.Condition()
+        self.latest = None
+        self.frames_read = 0
+        self.running = True
+        self.started = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        interval = 1.0 / self.fps
+        next_time = time.perf_counter()
+        frames_since_rewind = 0
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                if self.loop and self.is_file and frames_since_rewind:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    frames_since_rewind = 0
+                    continue
+                break
+            frames_since_rewind += 1
+            if self.is_file:
+                # Files decode faster than real time; pace them like a camera would deliver frames
+                next_time += interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+            with self.condition:
+                # Replaces any frame nobody picked up yet: that frame is dropped
+                self.latest = (self.frames_read, time.perf_counter(), frame)
+                self.frames_read += 1
+                self.condition.notify_all()
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    def next_frame(self, after_idx=-1, timeout=None):
+        # Newest (frame_idx, capture_time, frame) after after_idx; None once the source has ended
+        with self.condition:
+            self.condition.wait_for(lambda: not self.running or (self.latest is not None and self.latest[0] > after_idx), timeout)
+            if self.latest is not None and self.latest[0] > after_idx:
+                return self.latest
+            return None
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.cap.release()
+
+def iter_live_features(capture, crop_fraction=0.5, scale=1.0, num_colors=4, color_method='histogram', motion_backend='dis', scene_threshold=0.5):
+    # Yields one feature record per analysed frame, newest frame first. Besides the usual
+    # features a record has the capture frame index, its timestamp since capture start,
+    # its latency (capture to record), the frames dropped since the previous record and
+    # the shot index. Colors are tracked across frames and reset at scene cuts.
+    tracker = DominantColorTracker(num_colors=num_colors)
+    detector = SceneCutDetector(scene_threshold) if scene_threshold else None
+    prev_gray = None
+    prev_idx = None
+    last_idx = -1
+    shot = 0
+    while True:
+        latest = capture.next_frame(last_idx)
+        if latest is None:
+            return
+        frame_idx, captured_at, frame = latest
+        crop = crop_to_center(frame, crop_fraction)
+        if scale != 1.0:
+            crop = cv2.resize(crop, scaled_size(crop.shape[1], crop.shape[0], scale), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        cut = detector is not None and detector.update(frame)
+        if cut:
+            prev_gray = None
+            tracker.reset()
+            shot += 1
+        frame_gap = frame_idx - prev_idx if prev_idx is not None else 1
+        _, _, frame_data, color_hist, _ = analyze_frame_job((frame_idx, crop, gray, prev_gray, frame_gap, cut), num_colors=num_colors,
+                                                            color_method=color_method, track_colors=True, motion_backend=motion_backend,
+                                                            pixel_scale=scale)
+        frame_data['dominant_colors'] = dominant_colors_info(lab_to_rgb(tracker.update(*color_hist)))
+        record = {
+            'frame': frame_idx,
+            'timestamp': captured_at - capture.started,
+            'latency': time.perf_counter() - captured_at,
+            'dropped': frame_idx - last_idx - 1,
+            'shot': shot,
+        }
+        record.update(frame_data)
+        yield record
+        prev_gray, prev_idx, last_idx = gray, frame_idx, frame_idx
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract video features live from a camera, stream or looping file.')
+    parser.add_argument('--source', type=str, required=True, help='Camera index (e.g. 0), stream URL, or video file')
+    parser.add_argument('--loop', action='store_true', help='Restart a video file when it ends')
+    parser.add_argument('--max-records', type=int, default=None, help='Stop after this many records (default: run until the source ends)')
+    parser.add_argument('--crop-fraction', type=float, default=0.5, help='Fraction of the frame width/height kept by the center crop (default: 0.5)')
+    parser.add_argument('--decode-scale', type=float, default=1.0, help='Scale the center crop by this factor before analysis (default: 1.0)')
+    parser.add_argument('--num-colors', type=int, default=4, help='Dominant colors per frame (default: 4)')
+    parser.add_argument('--motion', type=str, choices=sorted(MOTION_BACKENDS), default='dis', help='Motion estimator (default: dis)')
+    parser.add_argument('--scene-threshold', type=float, default=0.5, help='Histogram distance (0-1) that marks a scene cut (default: 0.5, 0 disables)')
+    args = parser.parse_args()
+
+    init_worker()
+    capture = LiveCapture(args.source, loop=args.loop)
+    latencies = []
+    dropped = 0
+    try:
+        records = iter_live_features(capture, crop_fraction=args.crop_fraction, scale=args.decode_scale, num_colors=args.num_colors,
+                                     motion_backend=args.motion, scene_threshold=args.scene_threshold)
+        for record in records:
+            print(json.dumps(record), flush=True)
+            latencies.append(record['latency'])
+            dropped += record['dropped']
+            if args.max_records and len(latencies) >= args.max_records:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        capture.close()
+    if latencies:
+        print(f"{len(latencies)} records, {dropped} frames dropped, latency mean {np.mean(latencies) * 1000:.1f} ms, "
+              f"max {np.max(latencies) * 1000:.1f} ms (frame interval {1000 / capture.fps:.1f} ms)", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
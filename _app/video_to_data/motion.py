@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+# Motion estimators for analyze_frame. Each takes the previous and current gray
+# crops and returns one scalar. The flow-based backends return mean flow
+# magnitude in full-resolution pixels per frame, so they are interchangeable
+# with the original Farneback output; 'diff' returns mean absolute gray-level
+# change instead and only tracks it proportionally.
+
+# Number of pyrDown halvings before running the pyramid and phase backends
+PYRAMID_LEVELS = 2
+
+# DIS instances and Hanning windows are reusable, so keep one per worker process
+_dis_flow = None
+_hanning_windows = {}
+
+def downscale(gray, levels=PYRAMID_LEVELS):
+    for _ in range(levels):
+        gray = cv2.pyrDown(gray)
+    return gray
+
+def flow_magnitude(flow):
+    return float(np.mean(cv2.magnitude(flow[..., 0], flow[..., 1])))
+
+def farneback_motion(prev_gray, gray):
+    flow = cv2.calcOpticalFlowFarneback(prev_gray, gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+    return flow_magnitude(flow)
+
+def farneback_pyramid_motion(prev_gray, gray, levels=PYRAMID_LEVELS):
+    # Flow on a coarse pyramid level, scaled back up to full-resolution pixels
+    small_prev, small = downscale(prev_gray, levels), downscale(gray, levels)
+    flow = cv2.calcOpticalFlowFarneback(small_prev, small, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+    return flow_magnitude(flow) * (2 ** levels)
+
+def dis_motion(prev_gray, gray):
+    global _dis_flow
+    if _dis_flow is None:
+        _dis_flow = cv2.DISOpticalFlow_create(cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST)
+    return flow_magnitude(_dis_flow.calc(prev_gray, gray, None))
+
+def phase_motion(prev_gray, gray, levels=PYRAMID_LEVELS):
+    # Global translation between the frames from phase correlation; ignores local motion
+    small_prev = np.float32(downscale(prev_gray, levels))
+    small = np.float32(downscale(gray, levels))
+    window = _hanning_windows.get(small.shape)
+    if window is None:
+        window = _hanning_windows[small.shape] = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+    (dx, dy), _ = cv2.phaseCorrelate(small_prev, small, window)
+    return float(np.hypot(dx, dy)) * (2 ** levels)
+
+def diff_motion(prev_gray, gray):
+    # Frame-difference energy: mean absolute gray-level change
+    return float(cv2.mean(cv2.absdiff(prev_gray, gray))[0])
+
+MOTION_BACKENDS = {
+    'farneback': farneback_motion,
+    'farneback_pyramid': farneback_pyramid_motion,
+    'dis': dis_motion,
+    'phase': phase_motion,
+    'diff': diff_motion,
+}
+
+def estimate_motion(prev_gray, gray, backend='farneback', pixel_scale=1.0):
+    # pixel_scale is the size of the gray crops relative to the video's resolution;
+    # flow is scaled back to full-resolution pixels, gray-level change needs no scaling
+    if prev_gray is None:
+        return 0.0
+    try:
+        estimator = MOTION_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unsupported motion backend: {backend}")
+    motion = estimator(prev_gray, gray)
+    return motion if backend == 'diff' else motion / pixel_scale
@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Per-stage instrumentation for video_to_data. Code wraps its hot spots in
+# `with profiler.stage(name):`; each call records its duration and, while
+# tracemalloc is tracing, the peak memory allocated inside it. Pool workers
+# record into WORKER_PROFILER and ship their events back with each result,
+# where the run's Profiler merges them. summary() gives percentiles per stage,
+# frames/sec and peak RSS for the feature store manifest; with keep_events
+# every event is also kept for a Chrome trace (chrome://tracing, Perfetto).
+# Peaks are approximate when stages run concurrently in threads, since
+# tracemalloc keeps one peak per process.
+
+PERCENTILES = (50, 90, 99)
+
+class Profiler:
+    def __init__(self, keep_events=False):
+        self.keep_events = keep_events
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.durations = {}
+        self.peaks = {}
+        self.events = []
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - baseline if tracing else None
+            self.record((name, start, duration, peak, os.getpid(), threading.get_native_id()))
+
+    def record(self, event):
+        name, _, duration, peak, _, _ = event
+        with self.lock:
+            self.durations.setdefault(name, []).append(duration)
+            if peak is not None:
+                self.peaks[name] = max(self.peaks.get(name, 0), peak)
+            if self.keep_events:
+                self.events.append(event)
+
+    def merge(self, events):
+        for event in events:
+            self.record(event)
+
+    def drain(self):
+        # Worker side: the events recorded since the last drain, to send back with a result
+        with self.lock:
+            events = self.events
+            self.reset()
+        return events
+
+    def summary(self, frame_count):
+        wall_seconds = time.perf_counter() - self.started
+        stages = {}
+        with self.lock:
+            for name, durations in sorted(self.durations.items()):
+                ms = np.asarray(durations) * 1000
+                stats = {'count': len(ms), 'total_ms': float(ms.sum()), 'mean_ms': float(ms.mean())}
+                for percentile, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+                    stats[f'p{percentile}_ms'] = float(value)
+                stats['max_ms'] = float(ms.max())
+                if name in self.peaks:
+                    stats['peak_alloc_bytes'] = int(self.peaks[name])
+                stages[name] = stats
+        return {
+            'frames': frame_count,
+            'wall_seconds': wall_seconds,
+            'frames_per_second': frame_count / wall_seconds if wall_seconds > 0 else None,
+            'stages': stages,
+            'peak_rss_bytes': peak_rss(),
+        }
+
+    def write_chrome_trace(self, trace_path):
+        with self.lock:
+            events = list(self.events)
+        trace_events = [
+            {
+                'name': name,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': duration * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': {'peak_alloc_bytes': peak} if peak is not None else {},
+            } for name, start, duration, peak, pid, tid in events
+        ]
+        with open(trace_path, 'w') as trace_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+
+def format_profile(profile, top=8):
+    # The stages that took the most total time, as a small table for the console
+    lines = [f"{profile['frames']} frames in {profile['wall_seconds']:.1f}s ({profile['frames_per_second'] or 0:.1f} frames/sec)",
+             f"{'stage':<14}{'total s':>9}{'count':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}"]
+    stages = sorted(profile['stages'].items(), key=lambda item: -item[1]['total_ms'])
+    for name, stats in stages[:top]:
+        lines.append(f"{name:<14}{stats['total_ms'] / 1000:>9.2f}{stats['count']:>8}{stats['p50_ms']:>9.2f}{stats['p90_ms']:>9.2f}{stats['p99_ms']:>9.2f}")
+    return '\n'.join(lines)
+
+def peak_rss():
+    # Peak resident set size of this process and of its largest finished child (the pool workers)
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peaks = {'main': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit}
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    if children:
+        peaks['workers'] = children
+    return peaks
+
+# Used by code running in pool workers; always keeps its events until they are drained
+WORKER_PROFILER = Profiler(keep_events=True)
@@ -1,186 +1,984 @@
 import cv2
 import numpy as np
 import os
+import glob
 import json
-import csv
+import time
 import argparse
+import tracemalloc
 import webcolors
-from sklearn.cluster import MiniBatchKMeans
-from collections import Counter
-from multiprocessing import Pool
+from scipy.spatial import cKDTree
+from sklearn.cluster import MiniBatchKMeans, KMeans
+from collections import Counter, deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from threading import Thread, Event
+from queue import Queue, Empty, Full
 from tqdm import tqdm
+from _app.video_to_data.motion import estimate_motion, MOTION_BACKENDS
+from _app.video_to_data.frame_dumps import FrameDumpWriter, DUMP_MODES
+from _app.video_to_data.analysis_cache import AnalysisCache, CACHE_DIR, DEFAULT_MAX_BYTES
+from _app.video_to_data.frame_ring import FrameRing, read_slot
+from _app.video_to_data.frame_sources import open_frame_source, FRAME_SOURCES
+from _app.video_to_data.profiling import Profiler, WORKER_PROFILER, format_profile
+from _app.video_to_data.checkpoint import AnalysisCheckpoint, DEFAULT_CHECKPOINT_EVERY, video_identity
+from utils.feature_store import FeatureStore, frames_to_columns, write_feature_store, copy_feature_store
+
+# Number of decoded frames allowed to wait for a worker before decoding blocks
+FRAME_QUEUE_SIZE = 32
+# Shared-memory frame slots per worker; bounds the frames in flight between decoder and collector
+RING_SLOTS_PER_WORKER = 4
+# Frames submitted to the pool per worker and not yet collected; must stay below RING_SLOTS_PER_WORKER
+JOBS_IN_FLIGHT_PER_WORKER = 2
+
+def ring_slots(processes):
+    # Frames in flight are at most the submitted ones, a full frame queue and the one the decoder is
+    # handing off; slots beyond that are never used, which matters at 4K with many workers
+    return min(RING_SLOTS_PER_WORKER * processes, JOBS_IN_FLIGHT_PER_WORKER * processes + FRAME_QUEUE_SIZE + 1)
+# How often a blocked handoff checks whether the run is being stopped
+STOP_POLL_SECONDS = 0.1
+
+VIDEO_FOLDER = 'src/mp4'
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.mkv', '.avi', '.webm')
+
+# Bins per Lab channel for histogram clustering; 32 keeps each bin within 8 Lab units
+HIST_BINS = 32
+
+def build_css3_index():
+    # Built once at import: a KD-tree over the unique CSS3 colors plus two names per color.
+    # closest_names keeps the last CSS3 name for duplicated values (e.g. "grey" over "gray"),
+    # exact_names keeps the canonical name webcolors.rgb_to_name returns for an exact hit.
+    closest_by_rgb = {}
+    name_order = {}
+    for order, name in enumerate(webcolors.names("css3")):
+        rgb = tuple(webcolors.name_to_rgb(name))
+        closest_by_rgb[rgb] = name
+        name_order[rgb] = order
+    rgb_values = np.array(list(closest_by_rgb), dtype=np.int64)
+    closest_names = np.array(list(closest_by_rgb.values()))
+    exact_names = np.array([webcolors.rgb_to_name(tuple(rgb), spec="css3") for rgb in closest_by_rgb])
+    orders = np.array(list(name_order.values()))
+    return cKDTree(rgb_values), rgb_values, orders, closest_names, exact_names
+
+CSS3_TREE, CSS3_RGB, CSS3_ORDER, CSS3_CLOSEST_NAMES, CSS3_EXACT_NAMES = build_css3_index()
+
+def closest_color_indices(rgb_colors, candidates=4):
+    # Equidistant colors resolve to the one latest in CSS3 name order, as the old per-name loop did
+    rgb_colors = np.asarray(rgb_colors, dtype=np.int64).reshape(-1, 3)
+    _, idx = CSS3_TREE.query(rgb_colors, k=candidates)
+    distances = ((CSS3_RGB[idx] - rgb_colors[:, None, :]) ** 2).sum(axis=2)
+    ties = distances == distances.min(axis=1, keepdims=True)
+    best = np.where(ties, CSS3_ORDER[idx], -1).argmax(axis=1)
+    rows = np.arange(len(idx))
+    return idx[rows, best], distances[rows, best]
+
+def rgb_to_names(rgb_colors):
+    # Vectorised naming for many RGB triples at once
+    idx, distances = closest_color_indices(rgb_colors)
+    return np.where(distances == 0, CSS3_EXACT_NAMES[idx], CSS3_CLOSEST_NAMES[idx]).tolist()
 
 def closest_color(requested_color):
-    min_colors = {}
-    for name in webcolors.names("css3"):
-        r_c, g_c, b_c = webcolors.name_to_rgb(name)
-        rd = (r_c - requested_color[0]) ** 2
-        gd = (g_c - requested_color[1]) ** 2
-        bd = (b_c - requested_color[2]) ** 2
-        min_colors[(rd + gd + bd)] = name
-    return min_colors[min(min_colors.keys())]
+    idx, _ = closest_color_indices([requested_color])
+    return str(CSS3_CLOSEST_NAMES[idx[0]])
 
 def rgb_to_name(rgb_tuple):
-    try:
-        return webcolors.rgb_to_name(rgb_tuple)
-    except ValueError:
-        return closest_color(rgb_tuple)
+    return rgb_to_names([rgb_tuple])[0]
+
+def lab_to_rgb(colors_lab):
+    lab_colors = np.uint8([colors_lab])
+    rgb_colors = cv2.cvtColor(lab_colors, cv2.COLOR_Lab2RGB)
+    return rgb_colors.reshape(-1, 3).astype(int)
+
+def lab_histogram_bins(pixels_lab, bins=HIST_BINS):
+    # Bins uint8 Lab pixels into a bins^3 grid; returns the occupied bin indices with their pixel counts and Lab sums
+    shift = 8 - int(np.log2(bins))
+    quantized = (pixels_lab >> shift).astype(np.int32)
+    bin_idx = (quantized[:, 0] * bins + quantized[:, 1]) * bins + quantized[:, 2]
+    counts = np.bincount(bin_idx, minlength=bins ** 3)
+    occupied = np.flatnonzero(counts)
+    sums = np.stack([np.bincount(bin_idx, weights=pixels_lab[:, c], minlength=bins ** 3)[occupied] for c in range(3)], axis=1)
+    return occupied, counts[occupied].astype(np.float64), sums
+
+def lab_histogram(pixels_lab, bins=HIST_BINS):
+    # Mean color and pixel count of each occupied histogram bin
+    _, bin_counts, sums = lab_histogram_bins(pixels_lab, bins)
+    return sums / bin_counts[:, None], bin_counts
+
+class ColorAccumulator:
+    # Running Lab histogram for the whole video. Memory is fixed at bins^3 cells
+    # (about 1 MB at 32 bins) however many frames are added.
+    def __init__(self, bins=HIST_BINS):
+        self.counts = np.zeros(bins ** 3, dtype=np.float64)
+        self.sums = np.zeros((bins ** 3, 3), dtype=np.float64)
 
-def get_dominant_colors(image, num_colors=4):
+    def add(self, histogram_bins):
+        occupied, bin_counts, sums = histogram_bins
+        self.counts[occupied] += bin_counts
+        self.sums[occupied] += sums
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.sums += other.sums
+
+    def dominant_colors(self, num_colors=8):
+        occupied = np.flatnonzero(self.counts)
+        bin_counts = self.counts[occupied]
+        bin_colors = self.sums[occupied] / bin_counts[:, None]
+        return lab_to_rgb(cluster_histogram(bin_colors, bin_counts, num_colors))
+
+def cluster_histogram(bin_colors, bin_counts, num_colors):
+    if len(bin_colors) <= num_colors:
+        # Fewer distinct bins than clusters: every bin is its own color, padded by repetition
+        order = np.argsort(-bin_counts, kind='stable')
+        return np.resize(bin_colors[order], (num_colors, 3))
+    kmeans = KMeans(n_clusters=num_colors, n_init=10).fit(bin_colors, sample_weight=bin_counts)
+    cluster_weights = np.bincount(kmeans.labels_, weights=bin_counts, minlength=num_colors)
+    return kmeans.cluster_centers_[np.argsort(-cluster_weights, kind='stable')]
+
+def assign_clusters(bin_colors, bin_counts, centers):
+    # Nearest center per bin and the pixel-weighted mean squared distance (inertia per pixel)
+    distances = ((bin_colors[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    labels = distances.argmin(axis=1)
+    inertia = float((distances[np.arange(len(labels)), labels] * bin_counts).sum() / bin_counts.sum())
+    return labels, inertia
+
+class DominantColorTracker:
+    # Tracks dominant colors across consecutive frames by seeding each frame's
+    # clustering with the previous frame's centroids. A full re-initialisation
+    # only happens on the first frame or when the warm-started inertia jumps
+    # (e.g. a scene cut). Warm-started frames keep the previous color order.
+    def __init__(self, num_colors=4, reinit_ratio=1.5, max_iter=10, tol=0.5):
+        self.num_colors = num_colors
+        self.reinit_ratio = reinit_ratio
+        self.max_iter = max_iter
+        self.tol = tol
+        self.reset()
+
+    def reset(self):
+        self.centers = None
+        self.inertia = None
+
+    def refine(self, bin_colors, bin_counts, centers):
+        # Weighted Lloyd iterations from the given centers; empty clusters keep their old center
+        for _ in range(self.max_iter):
+            labels, _ = assign_clusters(bin_colors, bin_counts, centers)
+            weights = np.bincount(labels, weights=bin_counts, minlength=len(centers))
+            sums = np.stack([np.bincount(labels, weights=bin_colors[:, c] * bin_counts, minlength=len(centers)) for c in range(3)], axis=1)
+            new_centers = np.where(weights[:, None] > 0, sums / np.maximum(weights, 1)[:, None], centers)
+            shift = np.abs(new_centers - centers).max()
+            centers = new_centers
+            if shift < self.tol:
+                break
+        _, inertia = assign_clusters(bin_colors, bin_counts, centers)
+        return centers, inertia
+
+    def update(self, bin_colors, bin_counts):
+        if self.centers is not None:
+            centers, inertia = self.refine(bin_colors, bin_counts, self.centers)
+            if inertia <= self.reinit_ratio * max(self.inertia, 1.0):
+                self.centers, self.inertia = centers, inertia
+                return centers
+        self.centers = cluster_histogram(bin_colors, bin_counts, self.num_colors)
+        _, self.inertia = assign_clusters(bin_colors, bin_counts, self.centers)
+        return self.centers
+
+def frame_to_lab(image):
     image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
     image_rgb = cv2.GaussianBlur(image_rgb, (5, 5), 0)
-    image_lab = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2Lab)
+    return cv2.cvtColor(image_rgb, cv2.COLOR_RGB2Lab)
+
+def dominant_colors_info(colors):
+    return [
+        {
+            "rgb": color.tolist(),
+            "hex": webcolors.rgb_to_hex(tuple(color)),
+            "name": name
+        } for color, name in zip(colors, rgb_to_names(colors))
+    ]
+
+def dominant_colors_from_lab(image_lab, num_colors=4, method='pixels'):
+    if method == 'histogram':
+        # Cluster the occupied histogram bins weighted by pixel count, so cost tracks the palette, not the resolution
+        bin_colors, bin_counts = lab_histogram(image_lab.reshape(-1, 3))
+        return lab_to_rgb(cluster_histogram(bin_colors, bin_counts, num_colors))
+    if method != 'pixels':
+        raise ValueError(f"Unsupported color method: {method}")
     pixels = image_lab.reshape(-1, 3).astype(np.float32)
     kmeans = MiniBatchKMeans(n_clusters=num_colors, n_init=10).fit(pixels)
     colors_lab = kmeans.cluster_centers_
     labels = kmeans.labels_
     count = Counter(labels)
     sorted_colors_lab = [colors_lab[i] for i in sorted(count, key=count.get, reverse=True)]
-    sorted_colors_rgb = []
-    for color in sorted_colors_lab:
-        lab_color = np.uint8([[color]])
-        rgb_color = cv2.cvtColor(lab_color, cv2.COLOR_Lab2RGB)
-        sorted_colors_rgb.append(rgb_color.flatten())
-    return np.array(sorted_colors_rgb, dtype=int)
-
-def crop_to_center(frame, crop_fraction=0.5):
-    height, width, _ = frame.shape
-    start_x = int((1 - crop_fraction) / 2 * width)
-    start_y = int((1 - crop_fraction) / 2 * height)
-    end_x = int(start_x + crop_fraction * width)
-    end_y = int(start_y + crop_fraction * height)
-    return frame[start_y:end_y, start_x:end_x]
-
-def save_frame(image, folder_path, frame_idx, stage):
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-    file_path = os.path.join(folder_path, f'{stage}_frame_{frame_idx}.png')
-    cv2.imwrite(file_path, image)
-
-def process_frame(frame, frame_idx, output_dir):
-    cropped_frame = crop_to_center(frame)
-    save_frame(cropped_frame, output_dir, frame_idx, 'cropped')
-    frame_resized = cv2.resize(cropped_frame, (cropped_frame.shape[1] // 8, cropped_frame.shape[0] // 8))
-    save_frame(frame_resized, output_dir, frame_idx, 'resized')
-    return frame_resized.reshape(-1, 3)
-
-def analyze_frame(frame, prev_frame, frame_idx, output_dir):
-    cropped_frame = crop_to_center(frame)
-    save_frame(cropped_frame, output_dir, frame_idx, 'analyzed')
-    avg_color = cropped_frame.mean(axis=0).mean(axis=0).astype(float).tolist()
-    mask = cv2.inRange(cropped_frame, (0, 0, 0), (100, 100, 100))
-    mass = int(cv2.countNonZero(mask))
-    gray_frame = cv2.cvtColor(cropped_frame, cv2.COLOR_BGR2GRAY)
-    brightness = float(np.mean(gray_frame))
-    contrast = float(np.std(gray_frame))
-    motion = 0.0
-    if prev_frame is not None:
-        prev_cropped_frame = crop_to_center(prev_frame)
-        flow = cv2.calcOpticalFlowFarneback(cv2.cvtColor(prev_cropped_frame, cv2.COLOR_BGR2GRAY),
-                                            gray_frame, None, 0.5, 3, 15, 3, 5, 1.2, 0)
-        motion = float(np.mean(np.sqrt(flow[..., 0]**2 + flow[..., 1]**2)))
+    return lab_to_rgb(sorted_colors_lab)
+
+def get_dominant_colors(image, num_colors=4, method='pixels'):
+    return dominant_colors_from_lab(frame_to_lab(image), num_colors, method)
+
+class FrameContext:
+    # Per-frame intermediates computed once and shared by every feature: the
+    # center crop, its grayscale (plus the previous frame's, carried forward by
+    # the decoder for motion), the 1/8 downscaled crop, its blurred Lab image
+    # and the Lab histogram of that. frame_gap is how many frames back
+    # prev_gray was taken when frames are being sampled. pixel_scale is the
+    # size of the crop relative to the video's own resolution when the frame
+    # source already scaled it down; pixel-count features are scaled back.
+    def __init__(self, frame_idx, crop, gray, prev_gray=None, frame_gap=1, pixel_scale=1.0):
+        self.frame_idx = frame_idx
+        self.crop = crop
+        self.gray = gray
+        self.prev_gray = prev_gray
+        self.frame_gap = frame_gap
+        self.pixel_scale = pixel_scale
+        reduction = 8 * pixel_scale
+        if reduction > 1:
+            self.small = cv2.resize(crop, (int(crop.shape[1] / reduction), int(crop.shape[0] / reduction)))
+        else:
+            self.small = crop
+        self.lab = frame_to_lab(self.small)
+        self.histogram_bins = lab_histogram_bins(self.lab.reshape(-1, 3))
+
+    def histogram(self):
+        # Mean color and pixel count per occupied bin, as lab_histogram returns
+        _, bin_counts, sums = self.histogram_bins
+        return sums / bin_counts[:, None], bin_counts
+
+def analyze_frame(ctx, motion_backend='farneback', profiler=WORKER_PROFILER):
+    with profiler.stage('scalar'):
+        avg_color = list(cv2.mean(ctx.crop)[:3])
+        mask = cv2.inRange(ctx.crop, (0, 0, 0), (100, 100, 100))
+        mass = int(round(cv2.countNonZero(mask) / ctx.pixel_scale ** 2))
+        mean, std = cv2.meanStdDev(ctx.gray)
+        brightness = float(mean[0, 0])
+        contrast = float(std[0, 0])
+    with profiler.stage('flow'):
+        # Normalised to motion per frame when the previous analysed frame is further back
+        motion = estimate_motion(ctx.prev_gray, ctx.gray, motion_backend, ctx.pixel_scale) / ctx.frame_gap
     return avg_color, mass, brightness, contrast, motion
 
-def process_video_frames(video_path, frames_dir):
+def init_worker(trace_memory=False):
+    # Each worker is single threaded in OpenCV so the pool, not cv2, owns the cores
+    cv2.setNumThreads(1)
+    if trace_memory:
+        tracemalloc.start()
+
+def analyze_frame_job(job, num_colors=4, color_method='pixels', track_colors=False, motion_backend='farneback', pixel_scale=1.0):
+    # Returns (frame_idx, histogram_bins, frame_data, color_hist, profile_events)
+    profiler = WORKER_PROFILER
+    frame_idx, crop, gray, prev_gray, frame_gap, cut = job
+    if crop is None:
+        # Deduplicated frame: the collector repeats the previous result
+        return frame_idx, None, None, None, profiler.drain()
+    with profiler.stage('prepare'):
+        ctx = FrameContext(frame_idx, crop, gray, prev_gray, frame_gap, pixel_scale)
+
+    avg_color, mass, brightness, contrast, motion = analyze_frame(ctx, motion_backend, profiler)
+
+    if track_colors:
+        # Clustering happens in the collector, which sees frames in order; ship the compact histogram instead
+        color_hist = ctx.histogram()
+        dominant_colors = []
+    else:
+        color_hist = None
+        with profiler.stage('clustering'):
+            colors = dominant_colors_from_lab(ctx.lab, num_colors=num_colors, method=color_method)
+        with profiler.stage('naming'):
+            dominant_colors = dominant_colors_info(colors)
+
+    frame_data = {
+        'avg_color': avg_color,
+        'mass': mass,
+        'brightness': brightness,
+        'contrast': contrast,
+        'motion': motion,
+        'dominant_colors': dominant_colors,
+        'cut': cut
+    }
+    # Only the compact histogram bins leave the worker; they feed the video-wide ColorAccumulator
+    return frame_idx, ctx.histogram_bins, frame_data, color_hist, profiler.drain()
+
+class SceneCutDetector:
+    # Flags a cut when the hue/saturation histogram of a 64x36 thumbnail moves more than
+    # `threshold` (Bhattacharyya distance, 0..1) away from the previous decoded frame's.
+    def __init__(self, threshold=0.5):
+        self.threshold = threshold
+        self.prev_hist = None
+
+    def update(self, frame):
+        thumbnail = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0, 1], None, [16, 4], [0, 180, 0, 256])
+        cv2.normalize(hist, hist)
+        cut = self.prev_hist is not None and cv2.compareHist(self.prev_hist, hist, cv2.HISTCMP_BHATTACHARYYA) > self.threshold
+        self.prev_hist = hist
+        return cut
+
+def perceptual_hash(gray):
+    # 64-bit difference hash: sign of horizontal gradients on a 9x8 thumbnail
+    thumbnail = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def analyze_shared_frame_job(job, **kwargs):
+    # analyze_frame_job for frames handed over through a FrameRing: (frame_idx, descriptor, frame_gap, cut).
+    # Plain jobs are passed on as they are, for when the ring could not be allocated.
+    if len(job) != 4:
+        return analyze_frame_job(job, **kwargs)
+    frame_idx, descriptor, frame_gap, cut = job
+    crop, gray, prev_gray = read_slot(descriptor) if descriptor is not None else (None, None, None)
+    return analyze_frame_job((frame_idx, crop, gray, prev_gray, frame_gap, cut), **kwargs)
+
+class FrameSampler:
+    # Decides which frames get analysed: every stride-th frame, plus (in adaptive
+    # mode) any frame whose tiny grayscale thumbnail differs from the last
+    # analysed one by more than adaptive_threshold gray levels, so sampling gets
+    # dense around cuts and fast changes. The frame before each stride step is
+    # decoded too, as the motion reference. Adaptive mode decodes every frame.
+    def __init__(self, stride=1, adaptive_threshold=None):
+        self.stride = max(1, stride)
+        self.adaptive_threshold = adaptive_threshold
+        self.last_idx = None
+        self.last_thumbnail = None
+
+    def must_decode(self, frame_idx):
+        return self.adaptive_threshold is not None or self.on_stride(frame_idx) or self.on_stride(frame_idx + 1)
+
+    def on_stride(self, frame_idx):
+        return self.last_idx is None or frame_idx - self.last_idx >= self.stride
+
+    def thumbnail(self, frame):
+        return cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (32, 18), interpolation=cv2.INTER_AREA)
+
+    def seed(self, frame_idx, frame):
+        # Continues after frame_idx as if it had just been analysed, e.g. when resuming
+        self.last_idx = frame_idx
+        if self.adaptive_threshold is not None:
+            self.last_thumbnail = self.thumbnail(frame)
+
+    def should_analyze(self, frame_idx, frame):
+        thumbnail = None
+        take = self.on_stride(frame_idx)
+        if self.adaptive_threshold is not None:
+            thumbnail = self.thumbnail(frame)
+            if not take:
+                # Without a reference thumbnail there is nothing to compare against, so the frame is taken
+                take = self.last_thumbnail is None or cv2.mean(cv2.absdiff(thumbnail, self.last_thumbnail))[0] > self.adaptive_threshold
+        if take:
+            self.last_idx = frame_idx
+            self.last_thumbnail = thumbnail
+        return take
+
+def resolve_stride(fps, stride=1, target_fps=None):
+    if target_fps:
+        return max(1, int(round(fps / target_fps)))
+    return max(1, stride)
+
+def interpolate_frames(frame_indices, samples, frame_count, fps):
+    # Puts analysed samples back on the uniform per-frame timeline. Numeric features are
+    # interpolated linearly; dominant colors hold the most recent sample. Every record gets
+    # its timestamp and whether it was analysed ('sampled') or interpolated.
+    if not samples:
+        return []
+    frame_indices = np.asarray(frame_indices)
+    timeline = np.arange(frame_count)
+    numeric = {}
+    for key in ['mass', 'brightness', 'contrast', 'motion']:
+        numeric[key] = np.interp(timeline, frame_indices, [sample[key] for sample in samples])
+    avg_colors = np.array([sample['avg_color'] for sample in samples])
+    avg_color = np.stack([np.interp(timeline, frame_indices, avg_colors[:, c]) for c in range(avg_colors.shape[1])], axis=1)
+    held = np.clip(np.searchsorted(frame_indices, timeline, side='right') - 1, 0, len(samples) - 1)
+    sampled = np.zeros(frame_count, dtype=bool)
+    sampled[frame_indices[frame_indices < frame_count]] = True
+    shots = np.cumsum([sample.get('cut', False) for sample in samples])
+
+    frames = []
+    for i in timeline:
+        frames.append({
+            'timestamp': float(i / fps),
+            'sampled': bool(sampled[i]),
+            'shot': int(shots[held[i]]),
+            'avg_color': avg_color[i].tolist(),
+            'mass': int(round(numeric['mass'][i])),
+            'brightness': float(numeric['brightness'][i]),
+            'contrast': float(numeric['contrast'][i]),
+            'motion': float(numeric['motion'][i]),
+            'dominant_colors': samples[held[i]]['dominant_colors']
+        })
+    return frames
+
+def iter_sampled_frames(source, start, end, sampler=None, prev_gray=None, prev_idx=None, detector=None, dedupe_distance=None, profiler=None,
+                        last_hash=None):
+    # Yields (frame_idx, crop, gray, prev_gray, frame_gap, cut) jobs for the frames the sampler picks.
+    # Frames that are never looked at are only grabbed; any decoded frame becomes prev_gray
+    # for the next job, so motion is normally measured over a single frame step. A scene cut
+    # since the previous job sets `cut` and drops prev_gray, since flow across a cut is
+    # meaningless. With dedupe_distance, a frame whose perceptual hash is within that many
+    # bits of the last analysed frame in the same shot is sent without its image; last_hash is
+    # that frame's hash when continuing an earlier run.
+    sampler = sampler or FrameSampler()
+    profiler = profiler or Profiler()
+    pending_cut = False
+    for frame_idx in range(start, end):
+        if not sampler.must_decode(frame_idx):
+            with profiler.stage('grab'):
+                grabbed = source.grab()
+            if not grabbed:
+                return
+            continue
+        with profiler.stage('decode'):
+            ret, frame, crop = source.read()
+        if not ret:
+            return
+        if detector is not None:
+            with profiler.stage('cut_detect'):
+                if detector.update(frame):
+                    pending_cut = True
+                    prev_gray = None
+        with profiler.stage('crop'):
+            gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        with profiler.stage('sample'):
+            analyze = sampler.should_analyze(frame_idx, frame)
+        if analyze:
+            frame_gap = max(1, frame_idx - prev_idx) if prev_idx is not None else 1
+            frame_hash = None
+            if dedupe_distance is not None:
+                with profiler.stage('dedupe'):
+                    frame_hash = perceptual_hash(gray)
+            if frame_hash is not None and last_hash is not None and not pending_cut and bin(frame_hash ^ last_hash).count('1') <= dedupe_distance:
+                yield frame_idx, None, None, None, frame_gap, False
+            else:
+                yield frame_idx, crop, gray, prev_gray, frame_gap, pending_cut
+                last_hash = frame_hash
+            pending_cut = False
+        prev_gray = gray
+        prev_idx = frame_idx
+
+class FrameCollector:
+    # Ordered merge of per-frame results: feeds the overall color histogram, runs the
+    # color tracker (reset at scene cuts) and fills deduplicated frames in from the
+    # previous result. With a checkpoint, every record is also handed on to it. Profile
+    # events that come back with the results are merged into profiler.
+    def __init__(self, num_colors=4, track_colors=False, checkpoint=None, profiler=None):
+        self.frame_indices = []
+        self.data = []
+        self.color_accumulator = ColorAccumulator()
+        self.tracker = DominantColorTracker(num_colors=num_colors) if track_colors else None
+        self.checkpoint = checkpoint
+        self.profiler = profiler or Profiler()
+        self.last_color_bins = None
+
+    def restore(self, frame_indices, samples, color_bins):
+        # Continues from records loaded back from a checkpoint
+        self.frame_indices.extend(frame_indices)
+        self.data.extend(samples)
+        self.color_accumulator.add(color_bins)
+
+    def add(self, result):
+        frame_idx, color_bins, frame_data, color_hist, events = result
+        self.profiler.merge(events)
+        if frame_data is None:
+            frame_data = dict(self.data[-1], motion=0.0, cut=False)
+            color_bins = self.last_color_bins
+        elif self.tracker is not None:
+            if frame_data['cut']:
+                self.tracker.reset()
+            with self.profiler.stage('clustering'):
+                colors = lab_to_rgb(self.tracker.update(*color_hist))
+            with self.profiler.stage('naming'):
+                frame_data['dominant_colors'] = dominant_colors_info(colors)
+        # Duplicates are re-added so the overall colors stay weighted by screen time
+        self.color_accumulator.add(color_bins)
+        self.last_color_bins = color_bins
+        self.frame_indices.append(frame_idx)
+        self.data.append(frame_data)
+        if self.checkpoint is not None:
+            with self.profiler.stage('checkpoint'):
+                self.checkpoint.add(frame_idx, frame_data, color_bins)
+
+def seek_to(source, start, detector=None, collector=None, sampler=None):
+    # Positions the frame source at start by reading frame start - 1, which only seeds the
+    # motion reference, the cut detector, the collector's color tracker and the color bins a
+    # duplicate of it would reuse, and with a sampler (when resuming, start - 1 being the last
+    # analysed frame) the sampler. Returns (prev_gray, prev_idx).
+    source.seek(start - 1)
+    ret, frame, crop = source.read()
+    if not ret:
+        return None, None
+    prev_gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    if detector is not None:
+        detector.update(frame)
+    if sampler is not None:
+        sampler.seed(start - 1, frame)
+    if collector is not None:
+        ctx = FrameContext(start - 1, crop, prev_gray, pixel_scale=source.scale)
+        collector.last_color_bins = ctx.histogram_bins
+        if collector.tracker is not None:
+            collector.tracker.update(*ctx.histogram())
+    return prev_gray, start - 1
+
+def analyze_segment_job(segment, video_path, crop_fraction=0.5, stride=1, adaptive_threshold=None, scene_threshold=None, dedupe_distance=None,
+                        num_colors=4, color_method='pixels', track_colors=False, motion_backend='farneback', frame_source='cv2', decode_scale=1.0):
+    # Analyses frames [start, end) with its own frame source. Decoding starts one frame early so
+    # motion, scene cuts and color tracking at the segment start continue from the previous segment.
+    start, end = segment
+    profiler = WORKER_PROFILER
+    collector = FrameCollector(num_colors=num_colors, track_colors=track_colors, profiler=profiler)
+    sampler = FrameSampler(stride, adaptive_threshold)
+    detector = SceneCutDetector(scene_threshold) if scene_threshold else None
+
+    source = open_frame_source(video_path, frame_source, crop_fraction, decode_scale)
+    prev_gray, prev_idx = seek_to(source, start, detector, collector) if start else (None, None)
+
+    for job in iter_sampled_frames(source, start, end, sampler, prev_gray, prev_idx, detector, dedupe_distance, profiler):
+        collector.add(analyze_frame_job(job, num_colors=num_colors, color_method=color_method,
+                                        track_colors=track_colors, motion_backend=motion_backend, pixel_scale=source.scale))
+    source.release()
+    return collector.frame_indices, collector.data, collector.color_accumulator, profiler.drain()
+
+def process_video_segments(video_path, frame_count, segments, workers=None, pool=None, progress=None, profiler=None, **settings):
+    # Splits the video into equal time segments and analyses each one in its own process,
+    # so decoding is parallel too. Segment results are merged in order.
+    bounds = np.linspace(0, frame_count, segments + 1).astype(int)
+    segment_list = [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+    frame_indices = []
     data = []
-    all_colors = []
+    color_accumulator = ColorAccumulator()
+    analyze = partial(analyze_segment_job, video_path=video_path, **settings)
+    with nullcontext(pool) if pool is not None else Pool(processes=workers or cpu_count(), initializer=init_worker,
+                                                         initargs=(tracemalloc.is_tracing(),)) as pool:
+        with tqdm(total=frame_count, **(progress or {'desc': 'Processing Segments'})) as pbar:
+            segment_results = imap_bounded(pool, analyze, segment_list, workers or cpu_count())
+            for (start, end), (segment_indices, segment_data, segment_accumulator, events) in zip(segment_list, segment_results):
+                if profiler is not None:
+                    profiler.merge(events)
+                frame_indices.extend(segment_indices)
+                data.extend(segment_data)
+                color_accumulator.merge(segment_accumulator)
+                pbar.update(end - start)
+    return frame_indices, data, color_accumulator
+
+def put_unless_stopped(frame_queue, job, stop):
+    # Queue.put that gives up once stop is set; returns whether the job was queued
+    while not stop.is_set():
+        try:
+            frame_queue.put(job, timeout=STOP_POLL_SECONDS)
+            return True
+        except Full:
+            pass
+    return False
 
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+def decode_frames(source, frame_count, frame_queue, errors, sampler=None, detector=None, dedupe_distance=None, dumper=None,
+                  start=0, prev_gray=None, prev_idx=None, last_hash=None, ring=None, profiler=None, stop=None):
+    # Runs in its own thread: decodes and crops the sampled frames in order and queues them for the workers.
+    # With a ring, the frames go into shared memory and only their descriptors are queued.
+    # Setting stop (see stop_decoder) ends it early, also while it waits for a slot or for room in the queue.
+    stop = stop or Event()
+    try:
+        profiler = profiler or Profiler()
+        for frame_idx, crop, gray, prev_gray, frame_gap, cut in iter_sampled_frames(source, start, frame_count, sampler, prev_gray, prev_idx,
+                                                                                     detector, dedupe_distance, profiler, last_hash):
+            if stop.is_set():
+                break
+            if crop is not None and dumper is not None:
+                dumper.submit(frame_idx, crop)
+            if ring is not None and crop is not None and ring.shm is None and not ring.allocate([crop, gray, gray]):
+                if ring.closed:
+                    break
+                print(f"Not enough shared memory for {ring.slots} frame slots, handing frames to the workers pickled instead")
+                ring = None
+            if ring is not None:
+                descriptor = None
+                if crop is not None:
+                    # Includes waiting for a free slot when the workers fall behind
+                    with profiler.stage('handoff'):
+                        descriptor = ring.put(frame_idx, (crop, gray, prev_gray))
+                    if descriptor is None:
+                        break  # The ring was closed
+                if not put_unless_stopped(frame_queue, (frame_idx, descriptor, frame_gap, cut), stop):
+                    break
+                continue
+            if crop is not None:
+                # Only the crop crosses to the worker, a quarter of the full frame. It is pickled
+                # later by the pool, so copy it out of any buffer the source reuses.
+                with profiler.stage('handoff'):
+                    crop = np.array(crop)
+            if not put_unless_stopped(frame_queue, (frame_idx, crop, gray, prev_gray, frame_gap, cut), stop):
+                break
+    except Exception as e:
+        errors.append(e)
+    finally:
+        put_unless_stopped(frame_queue, None, stop)
+
+def iter_frame_queue(frame_queue):
+    while True:
+        job = frame_queue.get()
+        if job is None:
+            return
+        yield job
+
+def imap_bounded(pool, func, jobs, window):
+    # Like pool.imap, but submits from the calling thread with at most window jobs in flight. A pool has
+    # one task handler thread, which drains one imap's input before starting the next, so videos sharing
+    # a pool through imap run one after the other; submitted this way, their frames interleave.
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.apply_async(func, (job,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def stop_decoder(decoder, frame_queue, stop, ring=None):
+    # Ends the decode thread early and waits for it. Closing the ring wakes it if it waits for a slot,
+    # draining the queue if it waits for room.
+    stop.set()
+    if ring is not None:
+        ring.close()
+    while True:
+        try:
+            while True:
+                frame_queue.get_nowait()
+        except Empty:
+            pass
+        if not decoder.is_alive():
+            break
+        decoder.join(STOP_POLL_SECONDS)
+
+def process_video_frames(video_path, frames_dir, workers=None, dump_mode='off', dump_every=30, segments=0,
+                         crop_fraction=0.5, stride=1, target_fps=None, adaptive_threshold=None, scene_threshold=0.5, dedupe_distance=None,
+                         num_colors=4, color_method='pixels', track_colors=False, motion_backend='farneback', frame_source='cv2', decode_scale=1.0,
+                         checkpoint=None, resume=False, pool=None, progress=None, shared_memory=True, profiler=None):
+    # pool: a shared worker pool (one is created per call otherwise); progress: tqdm options for the progress bar;
+    # shared_memory: hand frames to the workers through a FrameRing instead of pickling them;
+    # profiler: collects per-stage timings from the decoder, the workers and the collector
+    profiler = profiler or Profiler()
+    with profiler.stage('open'):
+        source = open_frame_source(video_path, frame_source, crop_fraction, decode_scale)
+    fps = source.fps
+    frame_count = source.frame_count
     video_duration = frame_count / fps
+    stride = resolve_stride(fps, stride, target_fps)
 
-    prev_frame = None
+    if segments:
+        source.release()
+        if dump_mode != 'off':
+            print("Frame dumps are not written in segment mode")
+        if checkpoint is not None:
+            print("Checkpoints are not written in segment mode")
+        frame_indices, data, color_accumulator = process_video_segments(video_path, frame_count, segments, workers=workers, pool=pool, progress=progress,
+                                                                        crop_fraction=crop_fraction,
+                                                                        stride=stride, adaptive_threshold=adaptive_threshold, scene_threshold=scene_threshold,
+                                                                        dedupe_distance=dedupe_distance, num_colors=num_colors,
+                                                                        color_method=color_method, track_colors=track_colors, motion_backend=motion_backend,
+                                                                        frame_source=frame_source, decode_scale=decode_scale, profiler=profiler)
+        with profiler.stage('interpolate'):
+            frames = interpolate_frames(frame_indices, data, frame_count, fps)
+        return frames, color_accumulator, video_duration
 
-    with Pool() as pool:
-        with tqdm(total=frame_count, desc='Processing Frames') as pbar:
-            for frame_idx in range(frame_count):
-                ret, frame = cap.read()
-                if not ret:
-                    break
+    dumper = FrameDumpWriter(dump_mode, frames_dir, every=dump_every, fps=fps) if dump_mode != 'off' else None
+    sampler = FrameSampler(stride, adaptive_threshold)
+    detector = SceneCutDetector(scene_threshold) if scene_threshold else None
+    collector = FrameCollector(num_colors=num_colors, track_colors=track_colors, checkpoint=checkpoint, profiler=profiler)
+
+    start = 0
+    prev_gray, prev_idx, last_hash = None, None, None
+    if checkpoint is not None:
+        restored = checkpoint.load() if resume else None
+        if restored is None:
+            checkpoint.start()
+        else:
+            collector.restore(*restored)
+            start = collector.frame_indices[-1] + 1
+            print(f"Resuming after frame {start - 1} of {frame_count}")
+            prev_gray, prev_idx = seek_to(source, start, detector, collector, sampler)
+            if prev_gray is not None and dedupe_distance is not None:
+                last_hash = perceptual_hash(prev_gray)
 
-                colors = pool.apply(process_frame, args=(frame, frame_idx, frames_dir))
-                all_colors.extend(colors)
-
-                avg_color, mass, brightness, contrast, motion = analyze_frame(frame, prev_frame, frame_idx, frames_dir)
-
-                dominant_colors = get_dominant_colors(frame, num_colors=4)
-                dominant_colors_info = [
-                    {
-                        "rgb": color.tolist(),
-                        "hex": webcolors.rgb_to_hex(tuple(color)),
-                        "name": rgb_to_name(tuple(color))
-                    } for color in dominant_colors
-                ]
-
-                frame_data = {
-                    'avg_color': avg_color,
-                    'mass': mass,
-                    'brightness': brightness,
-                    'contrast': contrast,
-                    'motion': motion,
-                    'dominant_colors': dominant_colors_info
-                }
-                data.append(frame_data)
-
-                prev_frame = frame
-                pbar.update(1)
-
-    cap.release()
+    processes = workers or cpu_count()
+    ring = FrameRing(ring_slots(processes)) if shared_memory else None
+    frame_queue = Queue(maxsize=FRAME_QUEUE_SIZE)
+    decode_errors = []
+    stop = Event()
+    decoder = Thread(target=decode_frames, args=(source, frame_count, frame_queue, decode_errors, sampler, detector, dedupe_distance, dumper,
+                                                 start, prev_gray, prev_idx, last_hash, ring, profiler, stop), daemon=True)
+    decoder.start()
+
+    analyze = partial(analyze_shared_frame_job if ring is not None else analyze_frame_job, num_colors=num_colors, color_method=color_method,
+                      track_colors=track_colors, motion_backend=motion_backend, pixel_scale=source.scale)
+
+    try:
+        with nullcontext(pool) if pool is not None else Pool(processes=processes, initializer=init_worker,
+                                                             initargs=(tracemalloc.is_tracing(),)) as pool:
+            try:
+                with tqdm(total=frame_count, initial=start, **(progress or {'desc': 'Processing Frames'})) as pbar:
+                    # Results come back in frame order. The window stays below the ring's slot count, or
+                    # waiting for more frames while every slot is held by a submitted one would deadlock.
+                    for result in imap_bounded(pool, analyze, iter_frame_queue(frame_queue), JOBS_IN_FLIGHT_PER_WORKER * processes):
+                        collector.add(result)
+                        if ring is not None:
+                            ring.release(result[0])
+                        pbar.update(result[0] + 1 - pbar.n)
+            finally:
+                try:
+                    # Keep whatever was collected, also when the run is interrupted. Written first,
+                    # before any teardown that could be interrupted again or take a while.
+                    if checkpoint is not None:
+                        checkpoint.flush()
+                finally:
+                    # A no-op after a complete run. On an error or Ctrl-C the decoder is stopped too,
+                    # wherever it waits, instead of decoding on for a run that is over.
+                    stop_decoder(decoder, frame_queue, stop, ring)
+    finally:
+        if dumper is not None:
+            dumper.close()
+        source.release()
     cv2.destroyAllWindows()
 
-    return data, all_colors, video_duration
+    if decode_errors:
+        raise decode_errors[0]
 
-def main():
-    parser = argparse.ArgumentParser(description='Process a video file to extract data.')
-    parser.add_argument('--file-name', type=str, required=True, help='Name of the input video file (without extension)')
-    args = parser.parse_args()
+    with profiler.stage('interpolate'):
+        frames = interpolate_frames(collector.frame_indices, collector.data, frame_count, fps)
+    return frames, collector.color_accumulator, video_duration
 
-    video_path = f'/Users/simonvanstipriaan/Sites/generative-audio-v0/src/mp4/{args.file_name}.mp4'
-    output_dir = f'output/{args.file_name}'
-    json_dir = os.path.join(output_dir, 'json')
-    csv_dir = os.path.join(output_dir, 'csv')
-    frames_dir = os.path.join(output_dir, 'frames')
+def analyze_video(video_path, store_dir, settings, frames_dir=None, workers=None, dump_mode='off', dump_every=30, segments=0, cache=None,
+                  checkpoint_dir=None, checkpoint_every=DEFAULT_CHECKPOINT_EVERY, resume=False, pool=None, progress=None, trace_path=None,
+                  shared_memory=True):
+    # Writes the feature store for video_path to store_dir, reusing a cached analysis when the
+    # video bytes and settings match one. Returns True on a cache hit. With checkpoint_dir,
+    # progress is checkpointed there every checkpoint_every analysed frames and, with resume,
+    # an interrupted run of the same video and settings continues where it stopped. The run's
+    # per-stage profile goes into the store manifest, and with trace_path also a Chrome trace.
+    # shared_memory=False pickles frames to the workers instead of using a FrameRing.
+    profiler = Profiler(keep_events=trace_path is not None)
+    key = cache.key(video_path, settings) if cache is not None else None
+    cached_dir = cache.get(key) if cache is not None else None
+    if cached_dir is not None:
+        copy_feature_store(cached_dir, store_dir)
+        return True
 
-    os.makedirs(json_dir, exist_ok=True)
-    os.makedirs(csv_dir, exist_ok=True)
-    os.makedirs(frames_dir, exist_ok=True)
+    # Segment runs are not checkpointed
+    checkpoint = None
+    if checkpoint_dir and checkpoint_every and not segments:
+        checkpoint = AnalysisCheckpoint(checkpoint_dir, video_identity(video_path, settings), every=checkpoint_every)
 
-    json_file_path = os.path.join(json_dir, f'{args.file_name}.json')
-    csv_file_path = os.path.join(csv_dir, f'{args.file_name}.csv')
+    data, color_accumulator, video_duration = process_video_frames(video_path, frames_dir, workers=workers, dump_mode=dump_mode, dump_every=dump_every,
+                                                                   segments=segments, checkpoint=checkpoint, resume=resume, pool=pool, progress=progress,
+                                                                   shared_memory=shared_memory, profiler=profiler, **settings)
 
-    data, all_colors, video_duration = process_video_frames(video_path, frames_dir)
+    with profiler.stage('clustering'):
+        overall_dominant_colors = color_accumulator.dominant_colors(num_colors=8)
+    with profiler.stage('naming'):
+        overall_dominant_colors_info = dominant_colors_info(overall_dominant_colors)
 
-    all_colors = np.array(all_colors, dtype=np.uint8)
-    all_colors_image = np.zeros((1, len(all_colors), 3), dtype=np.uint8)
-    all_colors_image[0, :, :] = all_colors
-    overall_dominant_colors = get_dominant_colors(all_colors_image, num_colors=8)
-    overall_dominant_colors_info = [
-        {
-            "rgb": color.tolist(),
-            "hex": webcolors.rgb_to_hex(tuple(color)),
-            "name": rgb_to_name(tuple(color))
-        } for color in overall_dominant_colors
-    ]
+    with profiler.stage('columns'):
+        columns, palette = frames_to_columns(data)
+    # The store write itself is the one stage that cannot appear in its own manifest
+    profile = profiler.summary(len(data))
+    with profiler.stage('store'):
+        write_feature_store(store_dir, columns, palette, video_duration, overall_dominant_colors_info, settings=settings, profile=profile)
+    if trace_path is not None:
+        profiler.write_chrome_trace(trace_path)
+    if checkpoint is not None:
+        checkpoint.clear()
+    if cache is not None:
+        cache.put(key, store_dir)
+    return False
+
+def export_store(store_dir, output_dir, name, export_json=False, export_csv=False):
+    # Writes the optional JSON/CSV exports next to the feature store; returns their paths
+    store = FeatureStore(store_dir)
+    saved_paths = []
+    if export_json:
+        json_dir = os.path.join(output_dir, 'json')
+        os.makedirs(json_dir, exist_ok=True)
+        json_file_path = os.path.join(json_dir, f'{name}.json')
+        store.export_json(json_file_path)
+        saved_paths.append(json_file_path)
+
+    if export_csv:
+        csv_dir = os.path.join(output_dir, 'csv')
+        os.makedirs(csv_dir, exist_ok=True)
+        csv_file_path = os.path.join(csv_dir, f'{name}.csv')
+        store.export_csv(csv_file_path)
+        saved_paths.append(csv_file_path)
+    return saved_paths
+
+def find_videos(pattern):
+    # Video files in a directory, or matching a glob pattern ('**' recurses)
+    if os.path.isdir(pattern):
+        paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(path for path in paths if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS))
 
-    json_data = {
-        'video_duration': video_duration,
-        'overall_dominant_colors': overall_dominant_colors_info,
-        'frames': data
+def analyze_batch(video_paths, settings, output_root='output', workers=None, parallel_videos=2, segments=0, cache=None,
+                  checkpoint_every=DEFAULT_CHECKPOINT_EVERY, resume=False, export_json=False, export_csv=False, shared_memory=True):
+    # Analyses many videos on one shared worker pool. Cached videos are copied out up front;
+    # the rest run largest first, parallel_videos at a time, so one video's decoding or
+    # collecting never leaves the pool idle and the longest jobs don't end up last.
+    # Returns one summary entry per video; a failing video is recorded, not fatal.
+    results = []
+    pending = []
+    names = set()
+    for video_path in video_paths:
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        entry = {'name': name, 'video': video_path, 'size': os.path.getsize(video_path)}
+        results.append(entry)
+        if name in names:
+            entry['status'] = 'skipped'
+            entry['error'] = f"Another video named '{name}' is already in this batch"
+            continue
+        names.add(name)
+        entry['store'] = os.path.join(output_root, name, 'features')
+        if cache is not None:
+            cached_dir = cache.get(cache.key(video_path, settings))
+            if cached_dir is not None:
+                copy_feature_store(cached_dir, entry['store'])
+                entry['status'] = 'cached'
+                continue
+        pending.append(entry)
+    pending.sort(key=lambda entry: -entry['size'])
+
+    free_positions = list(range(parallel_videos, 0, -1))
+
+    def run(entry):
+        output_dir = os.path.join(output_root, entry['name'])
+        position = free_positions.pop()
+        start = time.perf_counter()
+        try:
+            analyze_video(entry['video'], entry['store'], settings, workers=workers, segments=segments, cache=cache,
+                          checkpoint_dir=os.path.join(output_dir, 'checkpoint'), checkpoint_every=checkpoint_every, resume=resume,
+                          pool=pool, progress={'desc': entry['name'], 'position': position, 'leave': False}, shared_memory=shared_memory)
+            entry['status'] = 'analysed'
+        except Exception as e:
+            entry['status'] = 'failed'
+            entry['error'] = str(e)
+        finally:
+            entry['seconds'] = round(time.perf_counter() - start, 3)
+            free_positions.append(position)
+
+    with Pool(processes=workers or cpu_count(), initializer=init_worker, initargs=(tracemalloc.is_tracing(),)) as pool:
+        with ThreadPoolExecutor(max_workers=parallel_videos) as executor:
+            with tqdm(total=len(pending), desc='Videos', position=0) as pbar:
+                for _ in executor.map(run, pending):
+                    pbar.update(1)
+
+    for entry in results:
+        if entry['status'] in ('analysed', 'cached'):
+            entry['frames_per_second'] = FeatureStore(entry['store']).manifest.get('profile', {}).get('frames_per_second')
+            entry['exports'] = export_store(entry['store'], os.path.join(output_root, entry['name']), entry['name'], export_json, export_csv)
+    return results
+
+def write_batch_manifest(manifest_path, results, settings):
+    summary = {status: sum(entry['status'] == status for entry in results) for status in ('analysed', 'cached', 'failed', 'skipped')}
+    with open(manifest_path, 'w') as manifest_file:
+        json.dump({'settings': settings, 'summary': summary, 'videos': results}, manifest_file, indent=4)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Process a video file to extract data.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file-name', type=str, help='Name of the input video file in --video-dir (without extension)')
+    source.add_argument('--batch', type=str, help='Analyse every video in a directory, or matching a glob pattern (quote it)')
+    parser.add_argument('--video-dir', type=str, default=VIDEO_FOLDER, help=f'Folder containing the --file-name video (default: {VIDEO_FOLDER})')
+    parser.add_argument('--parallel-videos', type=int, default=2, help='Videos analysed at once on the shared worker pool in --batch mode (default: 2)')
+    parser.add_argument('--manifest', type=str, default='output/batch_manifest.json', help='Summary manifest written in --batch mode')
+    parser.add_argument('--crop-fraction', type=float, default=0.5, help='Fraction of the frame width/height kept by the center crop (default: 0.5)')
+    parser.add_argument('--num-colors', type=int, default=4, help='Dominant colors per frame (default: 4)')
+    parser.add_argument('--stride', type=int, default=1, help='Analyse every Nth frame and interpolate the rest (default: 1)')
+    parser.add_argument('--target-fps', type=float, default=None, help='Analyse at roughly this frame rate instead of --stride')
+    parser.add_argument('--adaptive', action='store_true', help='Also analyse any skipped frame that differs noticeably from the last analysed one')
+    parser.add_argument('--adaptive-threshold', type=float, default=8.0, help='Mean thumbnail gray-level change that triggers analysis in --adaptive mode (default: 8)')
+    parser.add_argument('--scene-threshold', type=float, default=0.5,
+                        help='Histogram distance (0-1) that marks a scene cut; cuts reset color tracking and motion (default: 0.5, 0 disables)')
+    parser.add_argument('--dedupe', action='store_true', help='Reuse the previous result for near-identical frames instead of re-analysing them')
+    parser.add_argument('--dedupe-distance', type=int, default=2, help='Max perceptual-hash bit difference treated as identical in --dedupe mode (default: 2)')
+    parser.add_argument('--color-method', type=str, choices=['pixels', 'histogram'], default='pixels',
+                        help='Dominant color clustering: every pixel, or weighted bins of a Lab histogram (much faster on large frames)')
+    parser.add_argument('--track-colors', action='store_true',
+                        help='Warm-start each frame\'s color clustering from the previous frame (stable color order, re-initialised on scene cuts)')
+    parser.add_argument('--motion', type=str, choices=sorted(MOTION_BACKENDS), default='farneback',
+                        help='Motion estimator: full-resolution Farneback, Farneback on a coarse pyramid level, DIS flow, global phase correlation or frame-difference energy')
+    parser.add_argument('--frame-source', type=str, choices=sorted(FRAME_SOURCES), default='cv2',
+                        help='Decoder: OpenCV, or an ffmpeg pipe that crops and scales while decoding (falls back to OpenCV without ffmpeg)')
+    parser.add_argument('--decode-scale', type=float, default=1.0,
+                        help='Scale the center crop by this factor at decode time, e.g. 0.25 for 4K input (default: 1.0)')
+    parser.add_argument('--dump-frames', type=str, choices=DUMP_MODES, default='off',
+                        help='Debug frame output, written in the background: PNGs of every Nth frame, one contact sheet, or one preview video')
+    parser.add_argument('--dump-every', type=int, default=30, help='Dump every Nth frame (default: 30)')
+    parser.add_argument('--export-json', action='store_true', help='Also export the features as JSON (output/<name>/json)')
+    parser.add_argument('--export-csv', action='store_true', help='Also export the features as CSV (output/<name>/csv)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of analysis worker processes (default: one per core)')
+    parser.add_argument('--segments', type=int, default=0,
+                        help='Split the video into N time segments, each decoded and analysed by its own process (default: 0, one shared decoder)')
+    parser.add_argument('--no-shared-memory', action='store_true',
+                        help='Pickle frames to the workers instead of passing them through shared memory (for hosts with a small /dev/shm)')
+    parser.add_argument('--checkpoint-every', type=int, default=None,
+                        help=f'Checkpoint progress to output/<name>/checkpoint every N analysed frames (default: {DEFAULT_CHECKPOINT_EVERY}, 0 disables)')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted analysis from its last checkpoint')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Also record peak Python allocations per stage with tracemalloc (slows the analysis down)')
+    parser.add_argument('--trace', type=str, default=None, help='Write a Chrome trace of every stage to this JSON file (chrome://tracing or Perfetto)')
+    parser.add_argument('--cache-dir', type=str, default=CACHE_DIR, help=f'Analysis cache directory (default: {CACHE_DIR})')
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help='Evict least recently used cache entries beyond this size')
+    parser.add_argument('--no-cache', action='store_true', help='Always re-analyse, and do not store the result in the cache')
+    args = parser.parse_args()
+
+    # Everything that changes the analysis output; part of the cache key
+    settings = {
+        'crop_fraction': args.crop_fraction,
+        'stride': args.stride,
+        'target_fps': args.target_fps,
+        'adaptive_threshold': args.adaptive_threshold if args.adaptive else None,
+        'scene_threshold': args.scene_threshold,
+        'dedupe_distance': args.dedupe_distance if args.dedupe else None,
+        'num_colors': args.num_colors,
+        'color_method': args.color_method,
+        'track_colors': args.track_colors,
+        'motion_backend': args.motion,
+        'frame_source': args.frame_source,
+        'decode_scale': args.decode_scale,
     }
+    checkpoint_every = DEFAULT_CHECKPOINT_EVERY if args.checkpoint_every is None else args.checkpoint_every
+    if args.segments and (args.resume or args.checkpoint_every):
+        print("Checkpoints are not written in segment mode; ignoring --resume and --checkpoint-every")
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir, args.cache_max_mb * 1024 * 1024)
+    if args.profile_memory:
+        tracemalloc.start()
 
-    with open(json_file_path, 'w') as json_file:
-        json.dump(json_data, json_file, indent=4)
+    if args.batch:
+        video_paths = find_videos(args.batch)
+        if not video_paths:
+            raise SystemExit(f"No videos found for {args.batch}")
+        results = analyze_batch(video_paths, settings, workers=args.workers, parallel_videos=max(1, args.parallel_videos), segments=args.segments,
+                                cache=cache, checkpoint_every=checkpoint_every, resume=args.resume,
+                                export_json=args.export_json, export_csv=args.export_csv, shared_memory=not args.no_shared_memory)
+        summary = write_batch_manifest(args.manifest, results, settings)
+        for entry in results:
+            if entry['status'] in ('failed', 'skipped'):
+                print(f"{entry['status'].capitalize()}: {entry['video']}: {entry['error']}")
+        print(', '.join(f'{count} {status}' for status, count in summary.items()) + f"; summary written to {args.manifest}")
+        return
 
-    with open(csv_file_path, 'w', newline='') as csv_file:
-        fieldnames = ['avg_color', 'mass', 'brightness', 'contrast', 'motion', 'dominant_colors']
-        writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        writer.writeheader()
-        for entry in data:
-            entry['dominant_colors'] = str(entry['dominant_colors'])
-            writer.writerow(entry)
+    video_path = os.path.join(args.video_dir, f'{args.file_name}.mp4')
+    output_dir = f'output/{args.file_name}'
+    store_dir = os.path.join(output_dir, 'features')
+    frames_dir = os.path.join(output_dir, 'frames')
+    checkpoint_dir = os.path.join(output_dir, 'checkpoint')
 
-    print(f"Data has been saved to {json_file_path} and {csv_file_path}")
+    cache_hit = analyze_video(video_path, store_dir, settings, frames_dir=frames_dir, workers=args.workers,
+                              dump_mode=args.dump_frames, dump_every=args.dump_every, segments=args.segments, cache=cache,
+                              checkpoint_dir=checkpoint_dir, checkpoint_every=checkpoint_every, resume=args.resume, trace_path=args.trace,
+                              shared_memory=not args.no_shared_memory)
+    if cache_hit:
+        print(f"Reused cached analysis of {video_path}")
+    else:
+        print(format_profile(FeatureStore(store_dir).manifest['profile']))
+    saved_paths = [store_dir] + export_store(store_dir, output_dir, args.file_name, args.export_json, args.export_csv)
+    print(f"Data has been saved to {' and '.join(saved_paths)}")
 
 if __name__ == '__main__':
     main()
@@ -14,18 +14,14 @@ from colormath.color_diff import delta_e_cie2000
 # from audio.visualize_audio import plot_combined
 # from app.visualize_audio.visualize_audio import plot_combined
 from _app.visualize_audio.visualize_audio import plot_combined
-# from audio.audio_utils import generate_waveform
-from utils.audio_utils import generate_waveform
-# from audio.synthesis import apply_synthesis
-from _app.effects.synthesis import apply_synthesis
-# from audio.effects import apply_effects
-from _app.effects.effects import apply_effects   
-# from audio.envelope import apply_envelope
-from _app.effects.envelope import apply_envelope
+from _app.effects.timeline import FrameTimeline
+from utils.filters import brightness_cutoff
+from _app.effects.mixdown import PeakLimiter, peak_level, pan_stereo, loop_slice, repeat_chunks, to_pcm16, write_wav
 # from audio.drum_synthesis import generate_drum_beat, save_drum_beat
 from _app.effects.drum_synthesis import generate_drum_beat, save_drum_beat
 from midi2audio import FluidSynth
 from utils.nearest_color import find_nearest_color  # Import the function from the nearest_color file
+from utils.feature_store import FeatureStore, find_feature_stores, frame_column
 # from midi.experiment_v1 import add_music_layers
 from midi.experiments.experiment_v6 import add_music_layers
 import logging
@@ -51,6 +47,7 @@ app.logger.propagate = True
 # Define paths
 UPLOAD_FOLDER = 'output/sample_v2/audio'
 VIDEO_FOLDER = 'src/mp4'  # Path to the folder containing video files
+FEATURE_STORE_ROOT = 'output'  # Analysed videos live in output/<name>/features
 SOUNDFONT_PATH = 'src/FluidR3_GM/FluidR3_GM.sf2'  # Path to your SoundFont
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['VIDEO_FOLDER'] = VIDEO_FOLDER
@@ -130,105 +127,91 @@ def generate_audio(json_data, wave_type, file_name, synthesis_type, effects_type
     sample_rate = 44100  # Hz
     frame_duration = video_duration / len(frames)  # Duration per frame in seconds
     
-    # Create empty stereo audio data array with two channels
-    audio_data = np.zeros((int(sample_rate * video_duration), 2), dtype=np.float64)  # Stereo: two channels
-
-    # Process frames and generate waveform (assume stereo output from your synthesis functions)
-    for i, frame in enumerate(frames):
-        brightness = frame['brightness']
-        wave = generate_waveform(wave_type, sample_rate, frame_duration, brightness, stereo=True)  # Stereo waveform stereo var dones't exist?
-
-        if synthesis_type:
-            wave = apply_synthesis(wave, synthesis_type)
-        
-        if include_sine:
-            sine_wave = generate_waveform('sine', sample_rate, frame_duration, brightness, stereo=True)#stereo var dones't exist?
-            wave += sine_wave * 0.5  # Mix in sine wave
-
-        if envelope_type:
-            wave = apply_envelope(wave, envelope_type)
-        
-        # Apply effects
-        wave = apply_effects(wave, effects_type)
-        
-        # Calculate start and end indices in the audio data array
-        start_index = int(i * frame_duration * sample_rate)
-        end_index = start_index + len(wave)
-        
-        # Ensure end_index does not exceed the length of audio_data
-        if end_index > len(audio_data):
-            end_index = len(audio_data)
-            wave = wave[:end_index - start_index]
-
-        # Add wave to the audio data array
-        audio_data[start_index:end_index] += wave
-
-    # Handle drum synthesis if provided (assuming stereo drums)
+    # Each frame's brightness is its frequency, with the phase carried across frames, and sets
+    # how far the subtractive wave's lowpass opens
+    num_samples = int(sample_rate * video_duration)
+    brightness = frame_column(frames, 'brightness')
+    timeline = FrameTimeline(brightness, frame_duration, sample_rate, num_samples, cutoffs=brightness_cutoff(brightness))
+
+    # Handle drum synthesis if provided (mono, mixed into the generated audio before panning)
+    drum_loop = None
     if drum_params:
         drum_tempo, beats_per_measure, num_measures = drum_params
-        drum_signal = generate_drum_beat(drum_tempo, beats_per_measure, num_measures, stereo=True)
+        drum_signal = generate_drum_beat(drum_tempo, beats_per_measure, num_measures)
         drum_file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'drum_beat.wav')
         save_drum_beat(drum_file_path, drum_signal)
-        
-        # Mix drum signal with audio data (stereo)
-        drum_signal = np.resize(drum_signal, (len(audio_data), 2))  # Resize drum signal to match audio data length
-        audio_data += drum_signal * 0.2  # Adjust drum volume
+        drum_loop = drum_signal.astype(np.float32) * np.float32(0.2)  # Adjust drum volume
 
     # Convert MIDI to WAV if a MIDI file is provided
+    midi_wav_data = None
     if midi_file_path:
         midi_wav_file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'midi_output.wav')
         midi_to_wav(midi_file_path, midi_wav_file_path)
 
         try:
-            midi_wav_sample_rate, midi_wav_data = wav.read(midi_wav_file_path)
-            
+            # Memory-mapped: only the samples of the chunk being mixed are read
+            midi_wav_sample_rate, midi_wav_data = wav.read(midi_wav_file_path, mmap=True)
+
             # Check if the MIDI WAV is stereo and the sample rate matches
             if midi_wav_data.ndim == 2 and midi_wav_sample_rate == sample_rate:
                 app.logger.debug(f"MIDI WAV data shape: {midi_wav_data.shape}, dtype: {midi_wav_data.dtype}")
-                
-                # Resize midi_wav_data if necessary (preserving stereo)
-                if len(midi_wav_data) < len(audio_data):
-                    midi_wav_data = np.resize(midi_wav_data, (len(audio_data), 2))
-                elif len(midi_wav_data) > len(audio_data):
-                    audio_data = np.resize(audio_data, (len(midi_wav_data), 2))
-                
-                # Convert midi_wav_data to float64 for mixing
-                midi_wav_data = midi_wav_data.astype(np.float64)
-                
-                # Mix MIDI WAV with the generated audio data (both stereo)
-                audio_data += midi_wav_data * 0.5  # Adjust the mix level as needed
-
             else:
                 app.logger.error(f"MIDI WAV data not in expected format. Type: {type(midi_wav_data)}, Sample rate: {midi_wav_sample_rate}, Expected rate: {sample_rate}")
-        
+                midi_wav_data = None
+
         except Exception as e:
             app.logger.error(f"Error reading MIDI WAV file: {e}")
-
-    # Normalize the combined audio data
-    audio_data = audio_data / np.max(np.abs(audio_data))  # Normalize to [-1, 1] range
-
-    # Convert to int16 (stereo output)
-    final_audio_data = (audio_data * 32767).astype(np.int16)
-
-    # Save the final mixed stereo audio data to WAV file
+            midi_wav_data = None
+
+    def synth_chunks():
+        # One pass of the generated audio with the drum loop mixed in, still mono float32
+        for start, wave in timeline.iter_chunks(wave_type, synthesis_type, envelope_type, effects_type, include_sine):
+            if drum_loop is not None:
+                wave += loop_slice(drum_loop, start, start + len(wave))
+            yield start, wave
+
+    def mixed_chunks():
+        # A MIDI render longer than the video repeats the generated audio; a shorter one repeats itself
+        total_samples = max(num_samples, len(midi_wav_data)) if midi_wav_data is not None else num_samples
+        for start, wave in repeat_chunks(synth_chunks, num_samples, total_samples):
+            chunk = pan_stereo(wave)
+            if midi_wav_data is not None:
+                chunk += loop_slice(midi_wav_data, start, start + len(chunk)) * np.float32(0.5)  # Adjust the mix level as needed
+            yield chunk
+
+    # Normalize to [-1, 1] range: a first pass finds the loudest sample, the second writes the
+    # final mixed stereo audio to the WAV file chunk by chunk
+    limiter = PeakLimiter(peak=peak_level(mixed_chunks()))
     final_audio_file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-    wav.write(final_audio_file_path, sample_rate, final_audio_data)
+    write_wav(final_audio_file_path, sample_rate, (to_pcm16(limiter(chunk)) for chunk in mixed_chunks()))
 
     # Generate visualizations
     plot_combined(final_audio_file_path)
     return file_name
 
+# Function to load analysis data: a feature store picked in the form, or an uploaded JSON export
+def load_analysis(form, files):
+    store_name = form.get('feature_store')
+    if store_name and store_name in find_feature_stores(FEATURE_STORE_ROOT):
+        # Columns are memory-mapped; only the ones the renderer reads are touched
+        store = FeatureStore(os.path.join(FEATURE_STORE_ROOT, store_name, 'features'))
+        return store.to_json_data(), store_name
+
+    json_file = files.get('json_file')
+    if json_file and json_file.filename:
+        json_file_path = os.path.join('output/sample_v2/json', json_file.filename)
+        json_file.save(json_file_path)
+
+        with open(json_file_path, 'r') as f:
+            return json.load(f), os.path.splitext(json_file.filename)[0]
+
+    return None, None
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        json_file = request.files.get('json_file')
-        if json_file:
-            json_file_path = os.path.join('output/sample_v2/json', json_file.filename)
-            json_file.save(json_file_path)
-            
-            with open(json_file_path, 'r') as f:
-                json_data = json.load(f)
-            
+        json_data, source_name = load_analysis(request.form, request.files)
+        if json_data:
             wave_type = request.form['wave_type']
             synthesis_type = request.form['synthesis_type']
             effects_type = request.form['effects_type']
@@ -268,15 +251,15 @@ def index():
                 color['wav_file'] = f"sounds/{color_number}.wav"  # Path to the associated WAV file
                 instruments_used.append(color_number)
 
-            # Get the corresponding video file name (same as JSON filename but with .mp4)
-            video_filename = os.path.splitext(json_file.filename)[0] + '.mp4'
+            # Get the corresponding video file name (same as the analysed video's name but with .mp4)
+            video_filename = source_name + '.mp4'
 
             return render_template('result.html', file_name=file_name, 
                                 overall_dominant_colors=json_data['overall_dominant_colors'], 
                                 video_filename=video_filename,
                                 color_mapping=color_mapping,
                                 instruments_used=instruments_used)
-    return render_template('index.html')
+    return render_template('index.html', feature_stores=find_feature_stores(FEATURE_STORE_ROOT))
 
 @app.route('/sounds')
 def sounds():
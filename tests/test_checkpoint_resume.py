@@ -0,0 +1,115 @@
+import os
+import sys
+import signal
+import subprocess
+import cv2
+import numpy as np
+import pytest
+from _app.video_to_data import video_to_data
+from _app.video_to_data.checkpoint import AnalysisCheckpoint, video_identity
+
+# Interrupts an analysis with Ctrl-C (SIGINT) part way through, then resumes it
+# from the checkpoint and checks the result matches an uninterrupted run. The
+# checkpoint interval is larger than the video, so everything the resumed run
+# picks up was written by the flush on interrupt.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRAME_COUNT = 60
+INTERRUPT_AFTER = 20
+SETTINGS = {'num_colors': 3}
+
+# Runs in a child process: a slowed-down analysis that reports when it is far enough along to be interrupted
+INTERRUPTED_RUN = '''
+import sys, time, cv2
+cv2.destroyAllWindows = lambda: None
+from _app.video_to_data import video_to_data
+from _app.video_to_data.checkpoint import AnalysisCheckpoint, video_identity
+video_path, checkpoint_dir, interrupt_after = sys.argv[1], sys.argv[2], int(sys.argv[3])
+settings = {settings!r}
+add = video_to_data.FrameCollector.add
+def slow_add(self, result):
+    add(self, result)
+    if len(self.frame_indices) == interrupt_after:
+        print('interrupt', flush=True)
+    time.sleep(0.1)
+video_to_data.FrameCollector.add = slow_add
+checkpoint = AnalysisCheckpoint(checkpoint_dir, video_identity(video_path, settings), every=1000)
+video_to_data.process_video_frames(video_path, None, workers=2, checkpoint=checkpoint, progress={{'disable': True}}, **settings)
+print('finished', flush=True)
+'''.format(settings=SETTINGS)
+
+@pytest.fixture(autouse=True)
+def no_windows(monkeypatch):
+    # Headless test runs have no window system to tear down
+    monkeypatch.setattr(cv2, 'destroyAllWindows', lambda: None)
+
+@pytest.fixture
+def video_path(tmp_path):
+    # The picture moves every third frame; in between only its brightness changes, which
+    # leaves the perceptual hash alone, so those frames are near-duplicates
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (160, 120))
+    y, x = np.mgrid[:120, :160]
+    for i in range(FRAME_COUNT):
+        step = i // 3 * 3
+        frame = np.zeros((120, 160, 3), dtype=np.int16)
+        frame[..., 0] = (x + 3 * step) % 256
+        frame[..., 1] = (y * 2 + step) % 256
+        frame[..., 2] = 200 if i < FRAME_COUNT // 2 else 40  # A scene cut half way
+        frame[np.random.default_rng(step).random((120, 160)) < 0.02] = 255
+        frame += 8 * (i % 3)
+        writer.write(np.clip(frame, 0, 255).astype(np.uint8))
+    writer.release()
+    return path
+
+def test_interrupted_analysis_resumes(video_path, tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoint')
+    child = subprocess.Popen([sys.executable, '-c', INTERRUPTED_RUN, video_path, checkpoint_dir, str(INTERRUPT_AFTER)],
+                             cwd=REPO_ROOT, env=dict(os.environ, PYTHONPATH=REPO_ROOT),
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        assert child.stdout.readline().strip() == 'interrupt'
+        child.send_signal(signal.SIGINT)
+        # Hangs here if the interrupted run cannot shut down
+        output, _ = child.communicate(timeout=60)
+    finally:
+        child.kill()
+    assert child.returncode != 0
+    assert 'finished' not in output
+
+    checkpoint = AnalysisCheckpoint(checkpoint_dir, video_identity(video_path, SETTINGS), every=1000)
+    frame_indices, _, _ = checkpoint.load()
+    assert INTERRUPT_AFTER <= len(frame_indices) < FRAME_COUNT
+    assert frame_indices == list(range(len(frame_indices)))
+
+    resumed, _, _ = video_to_data.process_video_frames(video_path, None, workers=2, checkpoint=checkpoint, resume=True,
+                                                       progress={'disable': True}, **SETTINGS)
+    expected, _, _ = video_to_data.process_video_frames(video_path, None, workers=2, progress={'disable': True}, **SETTINGS)
+    assert len(resumed) == len(expected) == FRAME_COUNT
+    # Dominant colors come from unseeded k-means, so only their number is compared
+    for resumed_frame, expected_frame in zip(resumed, expected):
+        assert len(resumed_frame['dominant_colors']) == len(expected_frame['dominant_colors'])
+        for name in ('avg_color', 'mass', 'brightness', 'contrast', 'motion'):
+            assert resumed_frame[name] == pytest.approx(expected_frame[name], abs=1e-4)
+
+@pytest.mark.parametrize('settings', [
+    {'num_colors': 3, 'stride': 4, 'adaptive_threshold': 8},
+    {'num_colors': 3, 'dedupe_distance': 8},
+])
+def test_resume_continues_sampling_and_dedupe(video_path, tmp_path, settings):
+    # Resuming from an earlier chunk has to pick up the sampler's and the deduplication's
+    # reference frame, or the resumed run analyses different frames than an uninterrupted one.
+    # Here it resumes at frame 5, a near-duplicate of frame 4.
+    checkpoint = AnalysisCheckpoint(str(tmp_path / 'checkpoint'), video_identity(video_path, settings), every=5)
+    expected, _, _ = video_to_data.process_video_frames(video_path, None, workers=2, checkpoint=checkpoint,
+                                                        progress={'disable': True}, **settings)
+    checkpoint.flush()
+    for chunk_path in checkpoint.chunk_paths()[1:]:
+        os.remove(chunk_path)
+
+    resumed, _, _ = video_to_data.process_video_frames(video_path, None, workers=2, checkpoint=checkpoint, resume=True,
+                                                       progress={'disable': True}, **settings)
+    assert [frame['sampled'] for frame in resumed] == [frame['sampled'] for frame in expected]
+    for resumed_frame, expected_frame in zip(resumed, expected):
+        for name in ('avg_color', 'mass', 'brightness', 'contrast', 'motion'):
+            assert resumed_frame[name] == pytest.approx(expected_frame[name], abs=1e-4)
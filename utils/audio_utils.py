@@ -1,5 +1,11 @@
 import numpy as np
-from scipy.signal import butter, lfilter
+from scipy.signal import sosfilt
+from utils.filters import lowpass_sos, StreamingLowpass
+
+def float_wave(wave):
+    # The synthesis, envelope and effect stages work in place on float input (float32 on the render
+    # path); other dtypes are converted to a float32 copy first
+    return wave if np.issubdtype(wave.dtype, np.floating) else wave.astype(np.float32)
 
 def generate_waveform(wave_type, sample_rate, frame_duration, brightness, stereo=False):
     # Time array for waveform generation
@@ -20,8 +26,7 @@ def generate_waveform(wave_type, sample_rate, frame_duration, brightness, stereo
     elif wave_type == 'subtractive':
         # Example subtractive synthesis: low-pass filtered square wave
         square_wave = 0.5 * np.sign(np.sin(2 * np.pi * brightness * t))
-        b, a = butter(4, 0.1, btype='low')
-        wave = lfilter(b, a, square_wave)
+        wave = sosfilt(lowpass_sos(4, 0.1), square_wave)
     else:
         raise ValueError(f"Unsupported wave type: {wave_type}")
 
@@ -30,3 +35,47 @@ def generate_waveform(wave_type, sample_rate, frame_duration, brightness, stereo
         wave = np.column_stack((wave, wave))  # Duplicate for left and right channels
 
     return wave
+
+def timeline_waveform(wave_type, phase, lowpass=None, octave=None, bank=None):
+    # Same shapes as generate_waveform, evaluated at a per-sample phase in cycles (frequency already
+    # integrated), so the frequency can change from sample to sample without the phase jumping.
+    # Pass the same lowpass to consecutive chunks of one timeline to keep 'subtractive' continuous.
+    # Returns float32; the phase is wrapped to one cycle in float64 first, so no precision is lost.
+    # Given a WavetableBank and each sample's octave, the shapes with harmonics come from its
+    # band-limited tables; sines have nothing to alias and are computed directly, which is faster.
+    cycle = (phase % 1).astype(np.float32)
+    if bank is not None and octave is not None and wave_type in ('square', 'sawtooth', 'triangle', 'subtractive'):
+        if wave_type == 'subtractive':
+            wave = (lowpass or StreamingLowpass())(bank.lookup('square', cycle, octave)).astype(np.float32)
+        else:
+            wave = bank.lookup(wave_type, cycle, octave)
+    elif wave_type == 'sine':
+        wave = sine_cycle(cycle)
+    elif wave_type == 'square':
+        wave = np.sign(sine_cycle(cycle), out=cycle)
+        wave *= 0.5
+    elif wave_type == 'sawtooth':
+        # 0.5 * 2 * (phase - round(phase))
+        wave = cycle
+        wave[wave >= 0.5] -= 1
+    elif wave_type == 'triangle':
+        wave = cycle
+        wave -= 0.5
+        np.abs(wave, out=wave)
+    elif wave_type == 'additive':
+        wave = sine_cycle(cycle)
+        wave += sine_cycle((phase / 2 % 1).astype(np.float32))
+    elif wave_type == 'subtractive':
+        square_wave = np.sign(sine_cycle(cycle), out=cycle)
+        square_wave *= 0.5
+        wave = (lowpass or StreamingLowpass())(square_wave).astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported wave type: {wave_type}")
+    return wave
+
+def sine_cycle(cycle):
+    # 0.5 * sin(2 pi cycle), computed in place in cycle's dtype
+    wave = np.multiply(cycle, np.float32(2 * np.pi), dtype=cycle.dtype)
+    np.sin(wave, out=wave)
+    wave *= 0.5
+    return wave
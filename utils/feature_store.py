@@ -0,0 +1,222 @@
+import os
+import csv
+import json
+import shutil
+import numpy as np
+from collections.abc import Mapping, Sequence
+
+# Columnar store for per-frame video features: a directory holding manifest.json
+# plus one .npy file per column. Columns are memory-mapped on first access, so a
+# reader only touches the columns it actually uses.
+
+FORMAT_NAME = 'generative-audio-features'
+FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+# Scalar and vector columns taken straight from the frame records
+FRAME_COLUMNS = {
+    'avg_color': np.float32,
+    'mass': np.int32,
+    'brightness': np.float32,
+    'contrast': np.float32,
+    'motion': np.float32,
+}
+
+# Timeline columns; older JSON exports do not have them, so they are stored only when present
+OPTIONAL_COLUMNS = {
+    'timestamp': np.float64,
+    'sampled': np.bool_,
+    'shot': np.int32,
+}
+
+def frames_to_columns(frames):
+    # Converts frame dicts (as video_to_data produces them) into typed arrays.
+    # Dominant colors become an (N, K, 3) uint8 RGB array plus (N, K) indices into a name palette,
+    # K being the most any frame has; dominant_count says how many of each row are real, the rest is padding.
+    columns = {name: np.array([frame[name] for frame in frames], dtype=dtype) for name, dtype in FRAME_COLUMNS.items()}
+    for name, dtype in OPTIONAL_COLUMNS.items():
+        if frames and name in frames[0]:
+            columns[name] = np.array([frame[name] for frame in frames], dtype=dtype)
+    num_colors = max((len(frame['dominant_colors']) for frame in frames), default=0)
+    dominant_rgb = np.zeros((len(frames), num_colors, 3), dtype=np.uint8)
+    dominant_name = np.zeros((len(frames), num_colors), dtype=np.uint16)
+    dominant_count = np.array([len(frame['dominant_colors']) for frame in frames], dtype=np.uint16)
+    palette = {}
+    for i, frame in enumerate(frames):
+        for j, color in enumerate(frame['dominant_colors']):
+            dominant_rgb[i, j] = color['rgb']
+            dominant_name[i, j] = palette.setdefault(color['name'], len(palette))
+    columns['dominant_rgb'] = dominant_rgb
+    columns['dominant_name'] = dominant_name
+    columns['dominant_count'] = dominant_count
+    return columns, list(palette)
+
+def dominant_color_dicts(rgb, names, palette, count=None):
+    # One frame's row of the dominant color columns back as color dicts, without the padding past count
+    return [
+        {
+            'rgb': color.tolist(),
+            'hex': '#{:02x}{:02x}{:02x}'.format(*color.tolist()),
+            'name': palette[name]
+        } for color, name in zip(rgb[:count], names[:count])
+    ]
+
+def write_feature_store(store_dir, columns, palette, video_duration, overall_dominant_colors, **metadata):
+    # Written to a sibling temp directory and renamed into place, so readers never see a partial store
+    tmp_dir = store_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), values)
+    frame_count = len(next(iter(columns.values()))) if columns else 0
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'frame_count': frame_count,
+        'video_duration': video_duration,
+        'overall_dominant_colors': overall_dominant_colors,
+        'palette': palette,
+        'columns': {name: {'dtype': values.dtype.str, 'shape': list(values.shape)} for name, values in columns.items()},
+    }
+    manifest.update(metadata)
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4)
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    return store_dir
+
+def copy_feature_store(src_dir, dst_dir):
+    tmp_dir = dst_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(src_dir, tmp_dir)
+    shutil.rmtree(dst_dir, ignore_errors=True)
+    os.replace(tmp_dir, dst_dir)
+    return dst_dir
+
+def is_feature_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+def find_feature_stores(root='output'):
+    # Names of analysed videos under root that have a feature store (root/<name>/features)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if is_feature_store(os.path.join(root, name, 'features')))
+
+class FeatureStore:
+    def __init__(self, store_dir, mmap=True):
+        self.store_dir = store_dir
+        self.mmap_mode = 'r' if mmap else None
+        with open(os.path.join(store_dir, MANIFEST_FILE), 'r') as manifest_file:
+            self.manifest = json.load(manifest_file)
+        if self.manifest.get('format') != FORMAT_NAME:
+            raise ValueError(f"{store_dir} is not a feature store")
+        if self.manifest.get('version', 0) > FORMAT_VERSION:
+            raise ValueError(f"Feature store version {self.manifest['version']} is newer than supported version {FORMAT_VERSION}")
+        self._columns = {}
+
+    def __len__(self):
+        return self.manifest['frame_count']
+
+    @property
+    def video_duration(self):
+        return self.manifest['video_duration']
+
+    @property
+    def overall_dominant_colors(self):
+        return self.manifest['overall_dominant_colors']
+
+    def has_column(self, name):
+        return name in self.manifest['columns']
+
+    def column(self, name):
+        if name not in self._columns:
+            if not self.has_column(name):
+                raise KeyError(f"Feature store has no column '{name}'")
+            self._columns[name] = np.load(os.path.join(self.store_dir, f'{name}.npy'), mmap_mode=self.mmap_mode)
+        return self._columns[name]
+
+    @property
+    def frames(self):
+        return FrameSequence(self)
+
+    def to_json_data(self):
+        # Same shape as the JSON export, with frames read lazily from the columns
+        return {
+            'video_duration': self.video_duration,
+            'overall_dominant_colors': [dict(color) for color in self.overall_dominant_colors],
+            'frames': self.frames,
+        }
+
+    def export_json(self, json_file_path):
+        # Written frame by frame, so exporting a long video never holds all frames as dicts.
+        # The output is byte-identical to json.dump of to_json_data().
+        json_data = self.to_json_data()
+        with open(json_file_path, 'w') as json_file:
+            json_file.write('{"video_duration": ' + json.dumps(json_data['video_duration']))
+            json_file.write(', "overall_dominant_colors": ' + json.dumps(json_data['overall_dominant_colors']))
+            json_file.write(', "frames": [')
+            for i, frame in enumerate(json_data['frames']):
+                json_file.write((', ' if i else '') + json.dumps(dict(frame)))
+            json_file.write(']}')
+
+    def export_csv(self, csv_file_path):
+        with open(csv_file_path, 'w', newline='') as csv_file:
+            fieldnames = ['avg_color', 'mass', 'brightness', 'contrast', 'motion', 'dominant_colors']
+            writer = csv.DictWriter(csv_file, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for frame in self.frames:
+                entry = dict(frame)
+                entry['dominant_colors'] = str(entry['dominant_colors'])
+                writer.writerow(entry)
+
+class FrameRecord(Mapping):
+    # Read-only dict view of one frame; values are decoded from the columns on access
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def keys(self):
+        optional = [name for name in OPTIONAL_COLUMNS if self.store.has_column(name)]
+        return optional + list(FRAME_COLUMNS) + ['dominant_colors']
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        if key == 'dominant_colors':
+            return self.dominant_colors()
+        if key not in FRAME_COLUMNS and not (key in OPTIONAL_COLUMNS and self.store.has_column(key)):
+            raise KeyError(key)
+        value = self.store.column(key)[self.index]
+        return value.tolist() if np.ndim(value) else value.item()
+
+    def dominant_colors(self):
+        # Stores written before dominant_count existed have no padded rows to trim
+        count = int(self.store.column('dominant_count')[self.index]) if self.store.has_column('dominant_count') else None
+        return dominant_color_dicts(self.store.column('dominant_rgb')[self.index], self.store.column('dominant_name')[self.index],
+                                    self.store.manifest['palette'], count)
+
+class FrameSequence(Sequence):
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return FrameRecord(self.store, index)
+
+def frame_column(frames, name, dtype=np.float64):
+    # A feature as one array, straight from the store's column when frames came from a FeatureStore
+    if isinstance(frames, FrameSequence):
+        return np.asarray(frames.store.column(name), dtype=dtype)
+    return np.array([frame[name] for frame in frames], dtype=dtype)
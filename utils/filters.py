@@ -0,0 +1,103 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, sosfilt
+
+# Lowpass filtering for the synthesizer. Designs are second-order sections,
+# memoized so a cutoff is designed once per process. Filters carry their state
+# (zi) from one call to the next, so a signal filtered frame by frame or chunk
+# by chunk comes out as if filtered in one go. ModulatedLowpass changes its
+# cutoff from segment to segment (e.g. per video frame) by blending the two
+# nearest designs of a precomputed cutoff bank, which is far cheaper than
+# designing a filter per frame and stays stable for the bank's spacing. Bank
+# sections are scaled to unity DC gain each, so the carried state means the
+# same thing at every cutoff, and large cutoff jumps glide over a few short
+# steps instead of jolting the state.
+
+MIN_CUTOFF = 0.02  # Normalized to Nyquist
+MAX_CUTOFF = 0.5
+CUTOFF_BANK_SIZE = 64
+MAX_CUTOFF_STEP = 0.1  # Largest change of log(cutoff) in one step; bigger jumps glide
+GLIDE_SAMPLES = 32  # Length of each glide step
+
+@lru_cache(maxsize=256)
+def lowpass_sos(order, cutoff):
+    # Butterworth lowpass as second-order sections; shared between callers, who must not modify it
+    # (sosfilt wants a writable array, so it is not marked read-only)
+    return butter(order, cutoff, btype='low', output='sos')
+
+class StreamingLowpass:
+    def __init__(self, order=4, cutoff=0.1):
+        self.sos = lowpass_sos(order, cutoff)
+        self.zi = np.zeros((len(self.sos), 2))
+
+    def __call__(self, signal):
+        filtered, self.zi = sosfilt(self.sos, signal, zi=self.zi)
+        return filtered
+
+class CutoffFilterBank:
+    # Lowpass designs at geometrically spaced cutoffs; other cutoffs blend the two nearest designs
+    def __init__(self, order=4, min_cutoff=MIN_CUTOFF, max_cutoff=MAX_CUTOFF, size=CUTOFF_BANK_SIZE):
+        self.log_cutoffs = np.linspace(np.log(min_cutoff), np.log(max_cutoff), size)
+        self.designs = np.stack([lowpass_sos(order, cutoff) for cutoff in np.exp(self.log_cutoffs)])
+        dc_gains = self.designs[:, :, :3].sum(axis=2) / self.designs[:, :, 3:].sum(axis=2)
+        self.designs[:, :, :3] /= dc_gains[:, :, None]
+
+    def sos(self, cutoffs):
+        # (len(cutoffs), sections, 6) coefficients, cutoffs clipped to the bank's range
+        step = self.log_cutoffs[1] - self.log_cutoffs[0]
+        position = np.clip((np.log(cutoffs) - self.log_cutoffs[0]) / step, 0, len(self.designs) - 1)
+        lower = np.minimum(position.astype(np.int64), len(self.designs) - 2)
+        weight = (position - lower)[:, None, None]
+        return (1 - weight) * self.designs[lower] + weight * self.designs[lower + 1]
+
+@lru_cache(maxsize=16)
+def cutoff_filter_bank(order=4):
+    return CutoffFilterBank(order)
+
+class ModulatedLowpass:
+    def __init__(self, order=4):
+        self.bank = cutoff_filter_bank(order)
+        self.zi = np.zeros((self.bank.designs.shape[1], 2))
+        self.log_cutoff = None
+        self.glide_left = 0  # Samples left in the current glide step
+
+    def steps(self, log_cutoffs, counts):
+        # Splits segments into (log cutoff, length) steps. A cutoff more than MAX_CUTOFF_STEP away is
+        # approached in GLIDE_SAMPLES-long steps; the glide is timed in samples and carried between
+        # calls, so where segments or chunks are split does not change the output.
+        steps = []
+        for target, count in zip(log_cutoffs, counts):
+            if self.log_cutoff is None:
+                self.log_cutoff = target
+            while count > 0:
+                if not self.glide_left:
+                    delta = target - self.log_cutoff
+                    if abs(delta) <= MAX_CUTOFF_STEP:
+                        self.log_cutoff = target
+                        steps.append((target, count))
+                        break
+                    self.log_cutoff += np.copysign(MAX_CUTOFF_STEP, delta)
+                    self.glide_left = GLIDE_SAMPLES
+                length = min(self.glide_left, count)
+                steps.append((self.log_cutoff, length))
+                self.glide_left -= length
+                count -= length
+        return steps
+
+    def __call__(self, signal, cutoffs, counts):
+        # Filters consecutive segments of counts[i] samples at cutoffs[i]
+        filtered = np.empty(len(signal))
+        steps = self.steps(np.log(np.asarray(cutoffs, dtype=np.float64)), counts)
+        if not steps:
+            return filtered
+        log_cutoffs, lengths = zip(*steps)
+        offset = 0
+        for sos, length in zip(self.bank.sos(np.exp(log_cutoffs)), lengths):
+            filtered[offset:offset + length], self.zi = sosfilt(sos, signal[offset:offset + length], zi=self.zi)
+            offset += length
+        return filtered
+
+def brightness_cutoff(brightness):
+    # Frame brightness (0-255) to a lowpass cutoff: dark frames sound dull, bright frames open up.
+    # Mid-grey lands near the fixed 0.1 the subtractive wave used before.
+    return MIN_CUTOFF * (MAX_CUTOFF / MIN_CUTOFF) ** (np.clip(np.asarray(brightness, dtype=np.float64), 0, 255) / 255)
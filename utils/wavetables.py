@@ -0,0 +1,92 @@
+import os
+import zipfile
+from functools import lru_cache
+import numpy as np
+
+# Band-limited wavetables for the timeline oscillator. Each wave shape gets one
+# table per octave of fundamental frequency, holding only the harmonics that
+# stay below Nyquist for the highest fundamental of that octave, so nothing
+# aliases. The tables are cut from the spectrum of a heavily oversampled cycle
+# of the same formulas timeline_waveform evaluates directly, so levels and DC
+# offsets match. A sample then costs a table gather plus linear interpolation,
+# and the octave is looked up per frame, not per sample. Banks are built once
+# per sample rate and cached on disk.
+
+WAVETABLE_DIR = 'output/.cache/wavetables'
+WAVETABLE_VERSION = 1
+TABLE_SIZE = 2048
+OVERSAMPLING = 16
+BASE_FREQUENCY = 20.0  # Octave 0 holds fundamentals below 2 * BASE_FREQUENCY (and everything lower)
+NUM_OCTAVES = 11
+
+WAVE_SHAPES = {
+    'sine': lambda cycle: 0.5 * np.sin(2 * np.pi * cycle),
+    'square': lambda cycle: 0.5 * np.sign(np.sin(2 * np.pi * cycle)),
+    'sawtooth': lambda cycle: cycle - np.floor(cycle + 0.5),
+    'triangle': lambda cycle: np.abs(cycle - 0.5),
+}
+
+def build_tables(shape, sample_rate, table_size=TABLE_SIZE, num_octaves=NUM_OCTAVES):
+    # (num_octaves, table_size + 1) float32; the extra column repeats the first so interpolation never wraps
+    oversampled = table_size * OVERSAMPLING
+    spectrum = np.fft.rfft(shape(np.arange(oversampled) / oversampled))
+    tables = np.empty((num_octaves, table_size + 1), dtype=np.float32)
+    for octave in range(num_octaves):
+        highest_fundamental = BASE_FREQUENCY * 2 ** (octave + 1)
+        harmonics = min(int(sample_rate / 2 // highest_fundamental), table_size // 2 - 1)
+        band = np.zeros(table_size // 2 + 1, dtype=spectrum.dtype)
+        band[:harmonics + 1] = spectrum[:harmonics + 1]
+        tables[octave, :-1] = np.fft.irfft(band, n=table_size) / OVERSAMPLING
+        tables[octave, -1] = tables[octave, 0]
+    return tables
+
+class WavetableBank:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def octave(self, frequency):
+        # floor(log2(frequency / BASE_FREQUENCY)), read off the float exponent
+        _, exponent = np.frexp(np.asarray(frequency, dtype=np.float64) / BASE_FREQUENCY)
+        return np.clip(exponent - 1, 0, NUM_OCTAVES - 1).astype(np.int32)
+
+    def lookup(self, wave_type, cycle, octave):
+        # Samples at phase cycle (float32, in [0, 1]) from each sample's octave table (see octave())
+        tables = self.tables[wave_type]
+        table_size = tables.shape[1] - 1
+        position = cycle * np.float32(table_size)
+        index = position.astype(np.int32)
+        np.minimum(index, table_size - 1, out=index)
+        position -= index
+        index += octave * np.int32(table_size + 1)
+        flat = tables.ravel()
+        lower = np.take(flat, index)
+        index += 1
+        wave = np.take(flat, index)
+        wave -= lower
+        wave *= position
+        wave += lower
+        return wave
+
+def bank_path(sample_rate, cache_dir=WAVETABLE_DIR):
+    return os.path.join(cache_dir, f'bank_v{WAVETABLE_VERSION}_{sample_rate}hz_{TABLE_SIZE}x{NUM_OCTAVES}.npz')
+
+@lru_cache(maxsize=None)
+def wavetable_bank(sample_rate=44100, cache_dir=WAVETABLE_DIR):
+    path = bank_path(sample_rate, cache_dir)
+    try:
+        with np.load(path) as cached:
+            return WavetableBank({name: cached[name] for name in WAVE_SHAPES})
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        pass
+
+    tables = {name: build_tables(shape, sample_rate) for name, shape in WAVE_SHAPES.items()}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as bank_file:
+            np.savez(bank_file, **tables)
+        os.replace(tmp_path, path)
+    except OSError:
+        # Unwritable cache location: the bank still works, it is just rebuilt next time
+        pass
+    return WavetableBank(tables)